@@ -9,6 +9,9 @@ from posts.models import Post, Group
 def mock_media(settings):
     with tempfile.TemporaryDirectory() as temp_directory:
         settings.MEDIA_ROOT = temp_directory
+        # Миниатюры строятся в запросе, а не фоновым потоком, который
+        # мог бы писать в каталог, пока его удаляют.
+        settings.THUMBNAIL_WORKERS = 0
         yield temp_directory
 
 
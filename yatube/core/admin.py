@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.contrib import admin
+from django.utils import timezone
+
+from .jobs import enqueue
+from .mail import send_outbox
+from .models import Job, OutboxMessage
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'task', 'status', 'priority', 'attempts',
+                    'run_at', 'created',)
+    list_filter = ('status', 'task',)
+    search_fields = ('task',)
+    readonly_fields = ('task', 'arguments', 'status', 'attempts', 'created',
+                       'started', 'last_error',)
+    actions = ('retry_jobs',)
+
+    def retry_jobs(self, request, queryset):
+        updated = queryset.exclude(status=Job.RUNNING).update(
+            status=Job.QUEUED, attempts=0, run_at=timezone.now(),
+        )
+        self.message_user(request, f'Снова в очереди задач: {updated}')
+
+    retry_jobs.short_description = 'Перезапустить выбранные задачи'
+
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'subject', 'recipients', 'status', 'attempts',
+                    'send_at', 'created',)
+    list_filter = ('status',)
+    search_fields = ('subject', 'recipients',)
+    readonly_fields = ('subject', 'recipients', 'message', 'status',
+                       'attempts', 'send_at', 'created', 'started',
+                       'last_error',)
+    actions = ('resend_messages',)
+
+    def resend_messages(self, request, queryset):
+        updated = queryset.exclude(status=OutboxMessage.SENDING).update(
+            status=OutboxMessage.PENDING, attempts=0, send_at=timezone.now(),
+        )
+        if updated:
+            enqueue(send_outbox, priority=settings.OUTBOX_JOB_PRIORITY)
+        self.message_user(request, f'Снова в очереди писем: {updated}')
+
+    resend_messages.short_description = 'Отправить выбранные письма заново'
+
+
+admin.site.register(Job, JobAdmin)
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
@@ -0,0 +1,172 @@
+import gzip
+import json
+import time
+from collections import defaultdict
+from itertools import chain, islice
+
+from django.core import serializers
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+# Сколько символов файла читается за раз при разборе JSON-массива.
+READ_SIZE = 64 * 1024
+WHITESPACE = ' \t\r\n'
+
+
+def open_fixture(path):
+    """Текстовый поток файла, .gz распаковывается на лету."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def _iter_array(stream, buffer):
+    """Объекты JSON-массива по одному; `buffer` начинается после «[».
+
+    Элементы массива должны быть объектами, как в фикстурах Django:
+    незаконченный объект на границе прочитанного куска не разбирается,
+    а дочитывается.
+    """
+    decoder = json.JSONDecoder()
+    position = 0
+    eof = False
+    while True:
+        while True:
+            while position < len(buffer) and buffer[position] in (
+                WHITESPACE + ','
+            ):
+                position += 1
+            if position < len(buffer) or eof:
+                break
+            buffer, position = stream.read(READ_SIZE), 0
+            eof = not buffer
+        if position >= len(buffer):
+            raise ValueError('JSON-массив не закрыт')
+        if buffer[position] == ']':
+            return
+        try:
+            obj, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            more = '' if eof else stream.read(READ_SIZE)
+            if not more:
+                raise
+            buffer, position = buffer[position:] + more, 0
+            continue
+        yield obj
+
+
+def iter_objects(stream):
+    """Объекты фикстуры из JSON-массива или NDJSON, по одному.
+
+    Формат определяется по первому символу: «[» — массив, иначе
+    по объекту на строку.
+    """
+    buffer = stream.read(READ_SIZE).lstrip(WHITESPACE)
+    if buffer.startswith('['):
+        yield from _iter_array(stream, buffer[1:])
+        return
+    head = buffer + stream.readline()
+    for line in chain(head.splitlines(), stream):
+        if line.strip():
+            yield json.loads(line)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
+
+
+def insert_raw(model, instances, batch_size=1000, ignore_conflicts=False,
+               using=DEFAULT_DB_ALIAS):
+    """Вставляет объекты с заданными pk пачками INSERT, как bulk_create,
+    но raw, как loaddata: pre_save полей вроде auto_now_add
+    не перезаписывает их значения.
+    """
+    if any(instance.pk is None for instance in instances):
+        raise ValueError(f'У объектов {model._meta.label} нет pk')
+    fields = model._meta.concrete_fields
+    batch_size = min(
+        batch_size,
+        connections[using].ops.bulk_batch_size(fields, instances) or 1,
+    )
+    for batch in _chunks(instances, batch_size):
+        model._base_manager._insert(batch, fields=fields, raw=True,
+                                    using=using,
+                                    ignore_conflicts=ignore_conflicts)
+
+
+def reset_sequences(models, using=DEFAULT_DB_ALIAS):
+    """Сдвигает последовательности pk за вставленные вручную ключи,
+    чтобы следующий обычный INSERT не получил занятый pk.
+    """
+    connection = connections[using]
+    sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
+    if sequence_sql:
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+
+
+def _insert(model, objects, batch_size, ignore_conflicts, using):
+    insert_raw(model, [deserialized.object for deserialized in objects],
+               batch_size, ignore_conflicts, using)
+    relations = defaultdict(list)
+    for deserialized in objects:
+        for field_name, values in (deserialized.m2m_data or {}).items():
+            field = model._meta.get_field(field_name)
+            through = field.remote_field.through
+            source = field.m2m_field_name()
+            target = field.m2m_reverse_field_name()
+            relations[through].extend(
+                through(**{f'{source}_id': deserialized.object.pk,
+                           f'{target}_id': value})
+                for value in values
+            )
+    for through, rows in relations.items():
+        through._base_manager.using(using).bulk_create(
+            rows, batch_size=batch_size, ignore_conflicts=ignore_conflicts,
+        )
+
+
+def bulk_load(stream, batch_size=1000, chunk_size=10000,
+              ignore_conflicts=False, using=DEFAULT_DB_ALIAS,
+              progress=None):
+    """Загружает фикстуру из потока через bulk_create.
+
+    Объекты читаются по одному и группируются по моделям внутри
+    кусков по `chunk_size`; каждый кусок вставляется в своей
+    транзакции пачками INSERT по `batch_size`. Поля сохраняются как
+    в файле, как у loaddata. Внешние ключи проверяются
+    один раз в конце, поэтому объекты могут ссылаться на ещё
+    не загруженные; при ошибке уже загруженные куски остаются
+    в базе. Сигналы save не вызываются. `progress`
+    получает число загруженных строк и секунды с начала.
+    Возвращает {модель: число строк}.
+    """
+    connection = connections[using]
+    counts = defaultdict(int)
+    loaded = 0
+    start = time.perf_counter()
+    objects = serializers.deserialize('python', iter_objects(stream),
+                                      using=using)
+    with connection.constraint_checks_disabled():
+        for chunk in _chunks(objects, chunk_size):
+            by_model = defaultdict(list)
+            for deserialized in chunk:
+                by_model[type(deserialized.object)].append(deserialized)
+            with transaction.atomic(using=using):
+                for model, model_objects in by_model.items():
+                    _insert(model, model_objects, batch_size,
+                            ignore_conflicts, using)
+                    counts[model] += len(model_objects)
+            loaded += len(chunk)
+            if progress is not None:
+                progress(loaded, time.perf_counter() - start)
+    connection.check_constraints(
+        table_names=[model._meta.db_table for model in counts]
+    )
+    reset_sequences(list(counts), using)
+    return dict(counts)
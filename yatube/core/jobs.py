@@ -0,0 +1,168 @@
+import json
+import logging
+import time
+import traceback
+from concurrent import futures
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+def task(func):
+    """Разрешает ставить функцию в очередь через enqueue()."""
+    func.is_job_task = True
+    return func
+
+
+def enqueue(func, *args, priority=0, delay=None, max_attempts=None,
+            **kwargs):
+    """Ставит вызов задачи в очередь и сразу возвращает Job.
+
+    Аргументы должны сериализоваться в JSON. Внутри транзакции задача
+    видна обработчику только после её фиксации. Задача может
+    выполниться больше одного раза, если обработчик упал посреди неё.
+    """
+    if not getattr(func, 'is_job_task', False):
+        raise ValueError(f'{func!r} не отмечена декоратором @task')
+    return Job.objects.create(
+        task=f'{func.__module__}.{func.__qualname__}',
+        arguments=json.dumps({'args': args, 'kwargs': kwargs},
+                             cls=DjangoJSONEncoder),
+        priority=priority,
+        run_at=timezone.now() + (delay or timedelta()),
+        max_attempts=max_attempts or settings.JOB_MAX_ATTEMPTS,
+    )
+
+
+def retry_delay(attempts):
+    """Пауза перед следующей попыткой: растёт вдвое с каждой неудачей."""
+    return timedelta(seconds=settings.JOB_RETRY_DELAY * 2 ** (attempts - 1))
+
+
+def requeue_stale():
+    """Возвращает в очередь задачи, которые выполняются дольше
+    JOB_TIMEOUT: их обработчик, скорее всего, упал.
+
+    Зависший запуск считается попыткой: задача, у которой попытки
+    кончились, помечается неудачной, чтобы задача, роняющая или
+    вешающая обработчик, не возвращалась в очередь бесконечно.
+    Возвращает число задач, поставленных на повтор.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+    stale = Job.objects.filter(status=Job.RUNNING, started__lt=cutoff)
+    error = f'Обработчик не завершил задачу за {settings.JOB_TIMEOUT} с'
+    stale.filter(attempts__gte=F('max_attempts')).update(
+        status=Job.FAILED, last_error=error,
+    )
+    return stale.update(status=Job.QUEUED, last_error=error)
+
+
+def claim_jobs(limit):
+    """Забирает до `limit` готовых к запуску задач в порядке
+    приоритета и возвращает их id.
+
+    Задача достаётся тому обработчику, чей UPDATE первым сменил её
+    состояние, поэтому несколько обработчиков не выполнят её дважды.
+    """
+    now = timezone.now()
+    candidates = Job.objects.filter(
+        status=Job.QUEUED, run_at__lte=now
+    ).values_list('pk', flat=True)[:limit]
+    return [
+        pk for pk in list(candidates)
+        if Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING, started=now, attempts=F('attempts') + 1,
+        )
+    ]
+
+
+def run_job(pk):
+    """Выполняет забранную задачу; True, если она прошла успешно.
+
+    Успешная задача удаляется из очереди, неудачная ставится
+    на повтор или, когда попытки кончились, остаётся со статусом
+    «Не удалась».
+    """
+    job = Job.objects.filter(pk=pk).first()
+    if job is None:
+        return False
+    # Если задачу сочли зависшей и отдали другому обработчику,
+    # этот запуск её строку уже не трогает.
+    claimed = Job.objects.filter(pk=pk, started=job.started)
+    try:
+        func = import_string(job.task)
+        if not getattr(func, 'is_job_task', False):
+            raise ImportError(f'{job.task} не отмечена декоратором @task')
+        arguments = json.loads(job.arguments)
+        func(*arguments['args'], **arguments['kwargs'])
+    except Exception:
+        logger.exception('job %s (%s) failed', pk, job.task)
+        if job.attempts < job.max_attempts:
+            claimed.update(status=Job.QUEUED,
+                           last_error=traceback.format_exc(),
+                           run_at=timezone.now() + retry_delay(job.attempts))
+        else:
+            claimed.update(status=Job.FAILED,
+                           last_error=traceback.format_exc())
+        return False
+    claimed.delete()
+    return True
+
+
+def _run_in_worker(pk):
+    try:
+        return run_job(pk)
+    finally:
+        connection.close()
+
+
+def make_executor(workers, processes=False):
+    """Пул потоков или процессов для обработчика очереди."""
+    if not processes:
+        return futures.ThreadPoolExecutor(max_workers=workers,
+                                          thread_name_prefix='jobs')
+    # Дочерние процессы не должны унаследовать открытые соединения.
+    connections.close_all()
+    return futures.ProcessPoolExecutor(max_workers=workers,
+                                       initializer=django.setup)
+
+
+def work(executor, workers, once=False, poll_interval=None):
+    """Раздаёт задачи пулу, пока свободны его `workers` мест.
+
+    С `once` возвращается, когда готовых к запуску задач не осталось,
+    иначе опрашивает очередь раз в JOB_POLL_INTERVAL секунд.
+    Возвращает число успешных и неудачных запусков.
+    """
+    if poll_interval is None:
+        poll_interval = settings.JOB_POLL_INTERVAL
+    results = {True: 0, False: 0}
+    running = set()
+    while True:
+        if len(running) < workers:
+            requeue_stale()
+            running |= {
+                executor.submit(_run_in_worker, pk)
+                for pk in claim_jobs(workers - len(running))
+            }
+        if not running:
+            if once:
+                return results[True], results[False]
+            time.sleep(poll_interval)
+            continue
+        finished, running = futures.wait(
+            running, timeout=poll_interval,
+            return_when=futures.FIRST_COMPLETED,
+        )
+        for future in finished:
+            results[future.result()] += 1
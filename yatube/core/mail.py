@@ -0,0 +1,163 @@
+import base64
+import json
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .jobs import enqueue, retry_delay, task
+from .models import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+def dump_message(message):
+    """Письмо в виде JSON для таблицы исходящих."""
+    attachments = []
+    for attachment in message.attachments:
+        if not isinstance(attachment, tuple):
+            raise ValueError('Вложения MIMEBase в исходящие не сохраняются')
+        filename, content, mimetype = attachment
+        if isinstance(content, bytes):
+            content = {'base64': base64.b64encode(content).decode()}
+        attachments.append([filename, content, mimetype])
+    return json.dumps({
+        'subject': message.subject,
+        'body': message.body,
+        'from_email': message.from_email,
+        'to': message.to,
+        'cc': message.cc,
+        'bcc': message.bcc,
+        'reply_to': message.reply_to,
+        'headers': message.extra_headers,
+        'alternatives': getattr(message, 'alternatives', []),
+        'attachments': attachments,
+        'content_subtype': message.content_subtype,
+    })
+
+
+def load_message(data, connection=None):
+    """Письмо из JSON, сохранённого dump_message()."""
+    data = json.loads(data)
+    message = EmailMultiAlternatives(
+        data['subject'], data['body'], data['from_email'], data['to'],
+        bcc=data['bcc'], connection=connection, headers=data['headers'],
+        alternatives=[tuple(item) for item in data['alternatives']],
+        cc=data['cc'],
+        reply_to=data['reply_to'],
+    )
+    message.content_subtype = data['content_subtype']
+    for filename, content, mimetype in data['attachments']:
+        if isinstance(content, dict):
+            content = base64.b64decode(content['base64'])
+        message.attach(filename, content, mimetype)
+    return message
+
+
+class OutboxBackend(BaseEmailBackend):
+    """Почтовый бэкенд, который не отправляет письма, а сохраняет их
+    в таблицу исходящих и ставит в очередь задачу send_outbox.
+
+    Запрос не ждёт почтового сервера; настоящую отправку выполняет
+    транспорт OUTBOX_TRANSPORT в обработчике run_jobs.
+    """
+
+    def send_messages(self, email_messages):
+        rows = [
+            OutboxMessage(subject=message.subject,
+                          recipients=', '.join(message.recipients()),
+                          message=dump_message(message))
+            for message in email_messages if message.recipients()
+        ]
+        if not rows:
+            return 0
+        try:
+            with transaction.atomic():
+                OutboxMessage.objects.bulk_create(rows)
+                enqueue(send_outbox, priority=settings.OUTBOX_JOB_PRIORITY)
+        except Exception:
+            if not self.fail_silently:
+                raise
+            return 0
+        return len(rows)
+
+
+def requeue_stale_messages():
+    """Возвращает к отправке письма, застрявшие у упавшего обработчика."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+    return OutboxMessage.objects.filter(
+        status=OutboxMessage.SENDING, started__lt=cutoff
+    ).update(status=OutboxMessage.PENDING)
+
+
+def claim_messages(limit):
+    """Забирает до `limit` писем, которые пора отправить, как
+    core.jobs.claim_jobs забирает задачи.
+    """
+    now = timezone.now()
+    candidates = OutboxMessage.objects.filter(
+        status=OutboxMessage.PENDING, send_at__lte=now
+    ).values_list('pk', flat=True)[:limit]
+    return [
+        pk for pk in list(candidates)
+        if OutboxMessage.objects.filter(
+            pk=pk, status=OutboxMessage.PENDING
+        ).update(status=OutboxMessage.SENDING, started=now,
+                 attempts=F('attempts') + 1)
+    ]
+
+
+def _defer(outbox, error):
+    """Откладывает неотправленное письмо; возвращает время следующей
+    попытки или None, если письмо больше не отправляется.
+    """
+    failed = OutboxMessage.objects.filter(pk=outbox.pk)
+    if outbox.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+        failed.update(status=OutboxMessage.DEAD, last_error=error)
+        return None
+    send_at = timezone.now() + retry_delay(outbox.attempts)
+    failed.update(status=OutboxMessage.PENDING, send_at=send_at,
+                  last_error=error)
+    return send_at
+
+
+@task
+def send_outbox():
+    """Отправляет накопившиеся письма пачками по OUTBOX_BATCH_SIZE
+    через одно соединение транспорта и возвращает число отправленных.
+
+    Неотправленные письма откладываются с растущей паузой, и на время
+    ближайшей попытки ставится новая задача; после OUTBOX_MAX_ATTEMPTS
+    неудач письмо остаётся в таблице как недоставленное.
+    """
+    requeue_stale_messages()
+    sent = 0
+    retry_at = None
+    with get_connection(settings.OUTBOX_TRANSPORT) as connection:
+        while True:
+            pks = claim_messages(settings.OUTBOX_BATCH_SIZE)
+            if not pks:
+                break
+            delivered = []
+            for outbox in OutboxMessage.objects.filter(pk__in=pks):
+                try:
+                    connection.send_messages([load_message(outbox.message)])
+                except Exception:
+                    logger.exception('outbox message %s failed', outbox.pk)
+                    send_at = _defer(outbox, traceback.format_exc())
+                    if send_at is not None:
+                        retry_at = min(retry_at or send_at, send_at)
+                else:
+                    delivered.append(outbox.pk)
+            OutboxMessage.objects.filter(pk__in=delivered).delete()
+            sent += len(delivered)
+    if retry_at is not None:
+        enqueue(send_outbox, priority=settings.OUTBOX_JOB_PRIORITY,
+                delay=retry_at - timezone.now())
+    return sent
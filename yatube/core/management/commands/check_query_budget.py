@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from core import querybudget
+
+
+class Command(BaseCommand):
+    help = ('Открывает все страницы posts, users и about на тестовой базе '
+            'и сверяет число SQL-запросов с query_budget.json.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--update', action='store_true',
+            help='Записать текущие замеры и бюджет по ним с запасом; '
+                 'базовая линия остаётся прежней.',
+        )
+        parser.add_argument(
+            '--margin', type=int,
+            help='Запас запросов для --update, по умолчанию '
+                 'QUERY_BUDGET_MARGIN.',
+        )
+        parser.add_argument(
+            '--rebaseline', action='store_true',
+            help='С --update сделать текущие замеры базовой линией.',
+        )
+
+    def handle(self, *args, **options):
+        if options['margin'] is not None and options['margin'] < 0:
+            raise CommandError('--margin не может быть меньше 0')
+        budget = querybudget.load_budget()
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            # Как в TestCase: всё внутри транзакции, чтобы служебные
+            # SAVEPOINT считались одинаково.
+            with transaction.atomic():
+                user, values = querybudget.seed_dataset()
+                results = querybudget.measure(user, values)
+                transaction.set_rollback(True)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.stdout.write(querybudget.diff_table(budget, results))
+        if options['update']:
+            querybudget.save_budget(results, budget, options['margin'],
+                                    options['rebaseline'])
+            self.stdout.write(self.style.SUCCESS('Бюджет обновлён'))
+            return
+        failed = querybudget.over_budget(budget, results)
+        if failed:
+            raise CommandError(
+                f'Превышен бюджет запросов: {", ".join(failed)}'
+            )
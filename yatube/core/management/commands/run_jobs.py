@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.jobs import make_executor, work
+
+
+class Command(BaseCommand):
+    help = 'Выполняет задачи из очереди в пуле потоков или процессов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.JOB_WORKERS,
+            help='Сколько задач выполнять одновременно.',
+        )
+        parser.add_argument(
+            '--processes', action='store_true',
+            help='Запускать задачи в процессах, а не в потоках.',
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выйти, когда готовых к запуску задач не останется.',
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        with make_executor(workers, options['processes']) as executor:
+            try:
+                succeeded, failed = work(executor, workers, options['once'])
+            except KeyboardInterrupt:
+                return
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач: {succeeded}, с ошибкой: {failed}'
+        ))
@@ -0,0 +1,74 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """Отложенный вызов задачи из очереди core.jobs."""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (QUEUED, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (FAILED, 'Не удалась'),
+    )
+
+    task = models.CharField('Задача', max_length=200)
+    arguments = models.TextField('Аргументы', default='{}')
+    priority = models.SmallIntegerField(
+        'Приоритет', default=0,
+        help_text='Задачи с большим приоритетом выполняются раньше',
+    )
+    status = models.CharField('Состояние', max_length=10,
+                              choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    max_attempts = models.PositiveSmallIntegerField('Попыток не больше',
+                                                    default=1)
+    run_at = models.DateTimeField('Запустить не раньше', default=timezone.now)
+    created = models.DateTimeField('Поставлена', auto_now_add=True)
+    started = models.DateTimeField('Начата', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        ordering = ['-priority', 'run_at', 'pk']
+        indexes = [
+            models.Index(fields=['status', '-priority', 'run_at'],
+                         name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.task} #{self.pk}'
+
+
+class OutboxMessage(models.Model):
+    """Письмо, которое отправит фоновая задача core.mail.send_outbox."""
+    PENDING = 'pending'
+    SENDING = 'sending'
+    DEAD = 'dead'
+    STATUS_CHOICES = (
+        (PENDING, 'Ждёт отправки'),
+        (SENDING, 'Отправляется'),
+        (DEAD, 'Не доставлено'),
+    )
+
+    subject = models.CharField('Тема', max_length=998)
+    recipients = models.TextField('Получатели')
+    message = models.TextField('Письмо')
+    status = models.CharField('Состояние', max_length=10,
+                              choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    send_at = models.DateTimeField('Отправить не раньше',
+                                   default=timezone.now)
+    created = models.DateTimeField('Создано', auto_now_add=True)
+    started = models.DateTimeField('Начата отправка', null=True, blank=True)
+    last_error = models.TextField('Последняя ошибка', blank=True)
+
+    class Meta:
+        ordering = ['send_at', 'pk']
+        indexes = [
+            models.Index(fields=['status', 'send_at'],
+                         name='outbox_queue_idx'),
+        ]
+
+    def __str__(self):
+        return self.subject
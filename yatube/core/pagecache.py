@@ -0,0 +1,56 @@
+from functools import wraps
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.views.decorators.cache import cache_page
+
+GLOBAL_SCOPE = ('all',)
+
+
+def page_version_key(scope):
+    return 'page_version:' + ':'.join(str(part) for part in scope)
+
+
+def bump_page_version(*scope):
+    """Делает устаревшими закэшированные страницы области `scope`.
+
+    Без аргументов сбрасывает все страницы сразу.
+    """
+    cache.set(page_version_key(scope or GLOBAL_SCOPE), uuid4().hex, None)
+
+
+def page_cache_prefix(scope):
+    """Префикс ключа страницы из общей версии и версии области.
+
+    Пропавшая из кэша версия заводится заново, поэтому вытесненная
+    версия не может вернуть старую страницу.
+    """
+    keys = [page_version_key(GLOBAL_SCOPE), page_version_key(scope)]
+    versions = cache.get_many(keys)
+    fresh = {key: uuid4().hex for key in keys if key not in versions}
+    if fresh:
+        cache.set_many(fresh, None)
+        versions.update(fresh)
+    return ':'.join(
+        [page_version_key(scope)] + [versions[key] for key in keys]
+    )
+
+
+def versioned_cache_page(scope, timeout=None):
+    """Как cache_page, но ключ зависит от версии области страницы.
+
+    `scope` получает аргументы представления и возвращает кортеж,
+    например ('group', slug); сигналы моделей сбрасывают версию
+    через bump_page_version, и страница обновляется сразу.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            prefix = page_cache_prefix(scope(request, *args, **kwargs))
+            cached_view = cache_page(
+                timeout or settings.PAGE_CACHE_TIMEOUT, key_prefix=prefix
+            )(view)
+            return cached_view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,170 @@
+"""Бюджет SQL-запросов для страниц posts, users и about.
+
+Каждый маршрут открывается на заранее засеянных данных, для него
+считаются запросы и время ответа. Бюджет, базовая линия и последние
+замеры лежат в query_budget.json рядом с модулем.
+"""
+import json
+import os
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlencode, urlsafe_base64_encode
+
+from .utils import CursorPaginator
+
+BUDGET_PATH = os.path.join(os.path.dirname(__file__), 'query_budget.json')
+ROUTE_MODULES = ('posts.urls', 'users.urls', 'about.urls')
+# Параметры строки запроса, без которых маршрут не открывается:
+# маршрут -> {параметр: ключ в значениях seed_dataset()}.
+ROUTE_QUERIES = {'posts:comments_more': {'after': 'comments_after'}}
+SEED_POSTS = 15
+SEED_COMMENTS = 5
+
+
+def seed_dataset():
+    """Создаёт данные для замеров и возвращает читателя и значения
+    параметров маршрутов.
+    """
+    from posts.models import Comment, Follow, Group, Post
+
+    User = get_user_model()
+    reader = User.objects.create_user(username='budget_reader',
+                                      email='reader@example.com')
+    author = User.objects.create_user(username='budget_author',
+                                      first_name='Лев', last_name='Толстой')
+    group = Group.objects.create(title='Бюджет', slug='budget',
+                                 description='Группа для замеров')
+    Follow.objects.create(user=reader, author=author)
+    for number in range(SEED_POSTS):
+        post = Post.objects.create(text=f'Пост {number}', author=author,
+                                   group=group if number % 2 else None)
+    for number in range(SEED_COMMENTS):
+        Comment.objects.create(text=f'Комментарий {number}', post=post,
+                               author=reader)
+    comments_after = CursorPaginator(
+        Comment.objects.none(), 1, date_field='created'
+    ).encode_cursor(post.comments.latest('created'))
+    post = Post.objects.create(text='Пост читателя', author=reader,
+                               group=group)
+    values = {
+        'slug': group.slug,
+        'username': author.username,
+        'post_id': post.pk,
+        'uidb64': urlsafe_base64_encode(force_bytes(reader.pk)),
+        'token': default_token_generator.make_token(reader),
+        'comments_after': comments_after,
+    }
+    return reader, values
+
+
+def iter_routes(modules=ROUTE_MODULES):
+    """Имена маршрутов вида 'posts:index' и имена их параметров."""
+    for module_name in modules:
+        module = import_module(module_name)
+        for pattern in module.urlpatterns:
+            yield (f'{module.app_name}:{pattern.name}',
+                   list(pattern.pattern.converters))
+
+
+def measure(user, values, modules=ROUTE_MODULES):
+    """Число запросов и время ответа каждого маршрута на холодном кэше."""
+    results = {}
+    for name, params in iter_routes(modules):
+        url = reverse(name, kwargs={param: values[param]
+                                    for param in params})
+        if name in ROUTE_QUERIES:
+            url += '?' + urlencode({
+                param: values[key]
+                for param, key in ROUTE_QUERIES[name].items()
+            })
+        client = Client()
+        client.force_login(user)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            client.get(url)
+            duration = time.perf_counter() - start
+        results[name] = {
+            'queries': len(queries),
+            'duration_ms': round(duration * 1000, 2),
+        }
+    return results
+
+
+def load_budget(path=BUDGET_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as budget_file:
+        return json.load(budget_file)
+
+
+def save_budget(results, budget=None, margin=None, rebaseline=False,
+                path=BUDGET_PATH):
+    """Записывает текущие замеры и новый бюджет с запасом `margin`
+    запросов (по умолчанию QUERY_BUDGET_MARGIN).
+
+    Базовая линия из прошлого бюджета сохраняется, чтобы было с чем
+    сравнивать; с `rebaseline` ею становятся текущие замеры.
+    """
+    if margin is None:
+        margin = settings.QUERY_BUDGET_MARGIN
+    budget = budget or {}
+    entries = {}
+    for name, result in sorted(results.items()):
+        previous = {} if rebaseline else budget.get(name, {})
+        entries[name] = {
+            'budget': result['queries'] + margin,
+            'baseline': previous.get('baseline', result['queries']),
+            'baseline_ms': previous.get('baseline_ms',
+                                        result['duration_ms']),
+            'queries': result['queries'],
+            'duration_ms': result['duration_ms'],
+        }
+    with open(path, 'w', encoding='utf-8') as budget_file:
+        json.dump(entries, budget_file, indent=4, sort_keys=True)
+        budget_file.write('\n')
+
+
+def over_budget(budget, results):
+    """Маршруты, превысившие бюджет или ещё не имеющие его."""
+    return sorted(
+        name for name, result in results.items()
+        if name not in budget
+        or result['queries'] > budget[name]['budget']
+    )
+
+
+def diff_table(budget, results):
+    """Таблица замеров против базовой линии из бюджета."""
+    header = ('route', 'baseline', 'now', 'diff', 'budget', 'baseline ms',
+              'ms')
+    rows = []
+    for name, result in sorted(results.items()):
+        limits = budget.get(name, {})
+        baseline = limits.get('baseline')
+        diff = '' if baseline is None else result['queries'] - baseline
+        baseline_ms = limits.get('baseline_ms')
+        rows.append((
+            name, '-' if baseline is None else baseline, result['queries'],
+            f'{diff:+d}' if diff != '' else 'new',
+            limits.get('budget', '-'),
+            '-' if baseline_ms is None else f'{baseline_ms:.1f}',
+            f"{result['duration_ms']:.1f}",
+        ))
+    widths = [max(len(str(row[column])) for row in [header] + rows)
+              for column in range(len(header))]
+    lines = ['  '.join(str(value).ljust(width)
+                       for value, width in zip(row, widths))
+             for row in [header] + rows]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
@@ -0,0 +1,52 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.dispatch import Signal
+from django.utils.deconstruct import deconstructible
+
+# Отправляется, когда сохраняемый файл уже лежит в хранилище: приёмник
+# должен отметить файл `name` занятым, чтобы сборщик мусора его не удалил.
+content_reused = Signal(providing_args=['name'])
+
+
+def content_name(name, content):
+    """Путь файла по содержимому: каталог и расширение берутся
+    из `name`, а имя — SHA-256 содержимого, разложенный по двум
+    уровням подкаталогов.
+    """
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    key = digest.hexdigest()
+    extension = posixpath.splitext(name)[1].lower()
+    return posixpath.join(posixpath.dirname(name), key[:2], key[2:4],
+                          key + extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, где одинаковые файлы лежат в одном экземпляре.
+
+    Путь файла определяется его содержимым, поэтому повторная загрузка
+    той же картинки не пишет новый файл и получает те же миниатюры.
+    Кто ссылается на файл, хранилище не знает, поэтому удалять файл
+    можно только после проверки ссылок на него.
+    """
+
+    def _save(self, name, content):
+        name = content_name(name, content)
+        with transaction.atomic():
+            if self.exists(name):
+                content_reused.send(sender=type(self), name=name)
+                # Проверка после приёмников: сборщик, который успел
+                # удалить файл раньше, уже закончил, и файл пишется
+                # заново; начавший позже увидит отметку и файл оставит.
+                if self.exists(name):
+                    # Свежая дата изменения бережёт файл и от сборщика
+                    # сирот, пока ссылающийся пост ещё не сохранён.
+                    os.utime(self.path(name))
+                    return name
+        return super()._save(name, content)
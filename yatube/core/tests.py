@@ -0,0 +1,384 @@
+import gzip
+import json
+import os
+import shutil
+import smtplib
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.files.storage import FileSystemStorage
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageChops, ImageStat
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from posts.models import Comment, Post
+
+from . import querybudget
+from .jobs import claim_jobs, enqueue, requeue_stale, run_job, task
+from .mail import send_outbox
+from .models import Job, OutboxMessage
+from .thumbnail_engine import CompatEngine, Engine
+
+# Что записали задачи из тестов очереди.
+JOB_CALLS = []
+
+
+@task
+def record_call(value, suffix=''):
+    JOB_CALLS.append(value + suffix)
+
+
+@task
+def fail():
+    raise RuntimeError('задача упала')
+
+
+@task
+def reclaimed():
+    # Пока задача выполнялась, её сочли зависшей и забрал другой
+    # обработчик.
+    Job.objects.update(started=timezone.now() + timedelta(minutes=1))
+
+
+class RefusingBackend(BaseEmailBackend):
+    """Транспорт, который не принимает письма."""
+
+    def send_messages(self, email_messages):
+        raise smtplib.SMTPServerDisconnected('сервер недоступен')
+
+
+class QueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.values = querybudget.seed_dataset()
+
+    def test_views_within_query_budget(self):
+        """Ни одна страница не делает больше запросов, чем записано
+        в query_budget.json.
+        """
+        budget = querybudget.load_budget()
+        results = querybudget.measure(self.user, self.values)
+        self.assertFalse(
+            querybudget.over_budget(budget, results),
+            '\n' + querybudget.diff_table(budget, results),
+        )
+
+    def test_update_keeps_baseline(self):
+        """Обновление бюджета добавляет запас, сохраняет замеры
+        и не трогает базовую линию.
+        """
+        path = os.path.join(tempfile.mkdtemp(), 'budget.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        querybudget.save_budget({'posts:index': {'queries': 3,
+                                                 'duration_ms': 5.0}},
+                                path=path)
+        querybudget.save_budget(
+            {'posts:index': {'queries': 4, 'duration_ms': 7.5}},
+            querybudget.load_budget(path), margin=2, path=path,
+        )
+        self.assertEqual(querybudget.load_budget(path)['posts:index'], {
+            'budget': 6, 'baseline': 3, 'baseline_ms': 5.0,
+            'queries': 4, 'duration_ms': 7.5,
+        })
+        querybudget.save_budget(
+            {'posts:index': {'queries': 4, 'duration_ms': 7.5}},
+            querybudget.load_budget(path), margin=0, rebaseline=True,
+            path=path,
+        )
+        self.assertEqual(
+            querybudget.load_budget(path)['posts:index']['baseline'], 4
+        )
+
+
+class ThumbnailEngineTest(SimpleTestCase):
+    options = dict(default.backend.default_options, crop='center',
+                   upscale=True)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        storage = FileSystemStorage(location=cls.directory)
+        image = Image.linear_gradient('L').resize((3200, 2400))
+        image.convert('RGB').save(storage.path('photo.jpg'), 'JPEG')
+        cls.source = ImageFile('photo.jpg', storage)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.directory, ignore_errors=True)
+        super().tearDownClass()
+
+    def create(self, engine):
+        return engine.create(engine.get_image(self.source), (960, 339),
+                             self.options)
+
+    def test_same_thumbnail_as_stock_engine(self):
+        """Быстрый движок строит ту же миниатюру, что и стандартный."""
+        expected = self.create(CompatEngine())
+        thumbnail = self.create(Engine())
+        self.assertEqual(thumbnail.size, expected.size)
+        difference = ImageChops.difference(expected.convert('RGB'),
+                                           thumbnail.convert('RGB'))
+        self.assertLess(max(ImageStat.Stat(difference).mean), 1)
+
+    def test_source_decoded_once_at_reduced_scale(self):
+        """Внутри decoded_once источник отдаётся уже декодированным
+        в уменьшенном масштабе.
+        """
+        engine = Engine()
+        sizes = [('960x339', self.options), ('480x170', self.options)]
+        with engine.decoded_once(self.source, sizes) as decoded:
+            self.assertEqual(decoded.size, (1600, 1200))
+            self.assertEqual(engine.get_image(self.source).size,
+                             decoded.size)
+        self.assertEqual(engine.get_image(self.source).size, (3200, 2400))
+
+
+@override_settings(JOB_MAX_ATTEMPTS=2, JOB_RETRY_DELAY=60)
+class JobQueueTest(TestCase):
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def test_only_tasks_enqueued(self):
+        """Функцию без декоратора @task поставить в очередь нельзя."""
+        with self.assertRaises(ValueError):
+            enqueue(print, 'текст')
+
+    def test_jobs_claimed_by_priority(self):
+        """Сначала забираются задачи с большим приоритетом, отложенные
+        ждут своего времени.
+        """
+        low = enqueue(record_call, 'низкий')
+        high = enqueue(record_call, 'высокий', priority=10)
+        enqueue(record_call, 'позже', priority=20,
+                delay=timedelta(hours=1))
+        self.assertEqual(claim_jobs(1), [high.pk])
+        self.assertEqual(claim_jobs(5), [low.pk])
+        self.assertEqual(claim_jobs(5), [])
+
+    def test_job_runs_and_leaves_queue(self):
+        """Успешная задача получает свои аргументы и удаляется."""
+        job = enqueue(record_call, 'пост', suffix='!')
+        self.assertTrue(run_job(*claim_jobs(1)))
+        self.assertEqual(JOB_CALLS, ['пост!'])
+        self.assertFalse(Job.objects.filter(pk=job.pk).exists())
+
+    def test_failed_job_retried_with_backoff(self):
+        """Упавшая задача откладывается с растущей паузой, а после
+        последней попытки остаётся в очереди как неудачная.
+        """
+        job = enqueue(fail)
+        self.assertFalse(run_job(*claim_jobs(1)))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn('задача упала', job.last_error)
+        self.assertGreater(job.run_at,
+                           timezone.now() + timedelta(seconds=50))
+        self.assertEqual(claim_jobs(1), [])
+        Job.objects.update(run_at=timezone.now())
+        self.assertFalse(run_job(*claim_jobs(1)))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_stale_job_requeued(self):
+        """Задача зависшего обработчика возвращается в очередь."""
+        job = enqueue(record_call, 'пост')
+        claim_jobs(1)
+        self.assertEqual(requeue_stale(), 0)
+        Job.objects.update(started=timezone.now() - timedelta(minutes=2))
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(claim_jobs(1), [job.pk])
+
+    @override_settings(JOB_TIMEOUT=60)
+    def test_stale_job_fails_after_max_attempts(self):
+        """Задача, которая раз за разом вешает обработчик, после
+        последней попытки не возвращается в очередь.
+        """
+        job = enqueue(record_call, 'пост')
+        for requeued in (1, 0):
+            self.assertEqual(claim_jobs(1), [job.pk])
+            Job.objects.update(started=timezone.now() - timedelta(minutes=2))
+            self.assertEqual(requeue_stale(), requeued)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIn('не завершил', job.last_error)
+        self.assertEqual(claim_jobs(1), [])
+
+    def test_requeued_job_left_to_new_claim(self):
+        """Запуск, который сочли зависшим, не удаляет задачу,
+        забранную заново другим обработчиком.
+        """
+        job = enqueue(reclaimed)
+        self.assertTrue(run_job(*claim_jobs(1)))
+        self.assertTrue(Job.objects.filter(pk=job.pk).exists())
+
+
+class RunJobsCommandTest(TransactionTestCase):
+    def setUp(self):
+        JOB_CALLS.clear()
+
+    def test_worker_drains_queue(self):
+        """Обработчик выполняет все готовые задачи в пуле потоков."""
+        for number in range(5):
+            enqueue(record_call, str(number))
+        enqueue(fail, max_attempts=1)
+        out = StringIO()
+        # Один поток: тестовая база sqlite в памяти блокирует таблицу
+        # целиком и не ждёт, если потоки пишут в неё одновременно.
+        call_command('run_jobs', '--once', '--workers=1', stdout=out)
+        self.assertIn('Выполнено задач: 5, с ошибкой: 1', out.getvalue())
+        self.assertEqual(sorted(JOB_CALLS), ['0', '1', '2', '3', '4'])
+        self.assertEqual(
+            list(Job.objects.values_list('status', flat=True)), [Job.FAILED]
+        )
+
+
+@override_settings(
+    EMAIL_BACKEND='core.mail.OutboxBackend',
+    OUTBOX_TRANSPORT='django.core.mail.backends.locmem.EmailBackend',
+    OUTBOX_MAX_ATTEMPTS=2,
+)
+class OutboxTest(TestCase):
+    def test_password_reset_queued(self):
+        """Письмо сброса пароля не отправляется в запросе, а ложится
+        в исходящие и уходит из фоновой задачи через файловый транспорт.
+        """
+        get_user_model().objects.create_user(
+            username='reader', email='reader@example.com', password='pass'
+        )
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.client.post(reverse('users:password_reset_form'),
+                         {'email': 'reader@example.com'})
+        self.assertEqual(OutboxMessage.objects.count(), 1)
+        self.assertTrue(Job.objects.filter(task='core.mail.send_outbox'))
+        with self.settings(
+            OUTBOX_TRANSPORT='django.core.mail.backends.filebased.'
+                             'EmailBackend',
+            EMAIL_FILE_PATH=directory,
+        ):
+            self.assertEqual(send_outbox(), 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+        [name] = os.listdir(directory)
+        with open(os.path.join(directory, name)) as sent:
+            self.assertIn('To: reader@example.com', sent.read())
+
+    def test_message_sent_unchanged(self):
+        """Из исходящих уходит то же письмо, что было отправлено:
+        с копиями, HTML-версией и вложением.
+        """
+        message = mail.EmailMultiAlternatives(
+            'Тема', 'Текст', 'site@example.com', ['a@example.com'],
+            cc=['b@example.com'], headers={'X-Tag': 'reset'},
+        )
+        message.attach_alternative('<p>Текст</p>', 'text/html')
+        message.attach('data.bin', b'\x00\xff', 'application/octet-stream')
+        message.send()
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(send_outbox(), 1)
+        [sent] = mail.outbox
+        self.assertEqual(sent.recipients(), ['a@example.com',
+                                             'b@example.com'])
+        self.assertEqual(sent.alternatives, [('<p>Текст</p>', 'text/html')])
+        self.assertEqual(sent.attachments, [
+            ('data.bin', b'\x00\xff', 'application/octet-stream')
+        ])
+        self.assertEqual(sent.extra_headers, {'X-Tag': 'reset'})
+
+    @override_settings(OUTBOX_TRANSPORT='core.tests.RefusingBackend')
+    def test_failed_message_retried_then_dead(self):
+        """Неотправленное письмо откладывается с новой задачей на время
+        повтора, а после последней попытки становится недоставленным.
+        """
+        mail.send_mail('Тема', 'Текст', 'site@example.com',
+                       ['a@example.com'])
+        Job.objects.all().delete()
+        self.assertEqual(send_outbox(), 0)
+        outbox = OutboxMessage.objects.get()
+        self.assertEqual(outbox.status, OutboxMessage.PENDING)
+        self.assertIn('сервер недоступен', outbox.last_error)
+        self.assertGreater(outbox.send_at, timezone.now())
+        self.assertEqual(Job.objects.get().run_at.replace(microsecond=0),
+                         outbox.send_at.replace(microsecond=0))
+        OutboxMessage.objects.update(send_at=timezone.now())
+        self.assertEqual(send_outbox(), 0)
+        outbox.refresh_from_db()
+        self.assertEqual(outbox.status, OutboxMessage.DEAD)
+        self.assertEqual(Job.objects.count(), 1)
+
+
+class BulkLoadCommandTest(TestCase):
+    objects = [
+        {'model': 'posts.comment', 'pk': 7,
+         'fields': {'post': 5, 'author': 3, 'text': 'Комментарий',
+                    'created': '2020-01-02T00:00:00Z'}},
+        {'model': 'posts.post', 'pk': 5,
+         'fields': {'author': 3, 'text': 'Старый пост', 'image': '',
+                    'pub_date': '2020-01-01T00:00:00Z'}},
+        {'model': 'posts.post', 'pk': 6,
+         'fields': {'author': 3, 'text': 'Ещё пост', 'image': '',
+                    'pub_date': '2020-01-01T12:00:00Z'}},
+        {'model': 'auth.user', 'pk': 3,
+         'fields': {'username': 'loaded', 'password': '', 'email': '',
+                    'date_joined': '2019-12-31T00:00:00Z'}},
+    ]
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def load(self, name, content, opener=open):
+        path = os.path.join(self.directory, name)
+        with opener(path, 'wt', encoding='utf-8') as fixture:
+            fixture.write(content)
+        out = StringIO()
+        call_command('bulkload', path, '--batch-size=1', '--chunk-size=2',
+                     stdout=out)
+        return out.getvalue()
+
+    def assert_loaded(self):
+        post = Post.objects.get(pk=5)
+        self.assertEqual(post.author.username, 'loaded')
+        self.assertEqual(post.pub_date.year, 2020)
+        self.assertEqual(Comment.objects.get(pk=7).post, post)
+        self.assertEqual(Post.objects.filter(author_id=3).count(), 2)
+
+    @mock.patch('core.bulkload.READ_SIZE', 16)
+    def test_json_array_loaded_in_chunks(self):
+        """JSON-массив читается кусками, объекты ссылаются на ещё
+        не загруженные, даты из файла сохраняются.
+        """
+        out = self.load('dump.json', json.dumps(self.objects, indent=2))
+        self.assert_loaded()
+        self.assertIn('posts.Post: 2', out)
+        self.assertIn('4 строк', out)
+        self.assertIn('строк/с', out)
+
+    def test_ndjson_gzip_loaded(self):
+        """Сжатый NDJSON загружается так же, как JSON-массив."""
+        self.load('dump.ndjson.gz',
+                  '\n'.join(json.dumps(obj) for obj in self.objects),
+                  opener=gzip.open)
+        self.assert_loaded()
+
+    def test_broken_reference_rejected(self):
+        """Ссылка на отсутствующую строку останавливает загрузку."""
+        with transaction.atomic():
+            with self.assertRaises(CommandError):
+                self.load('dump.json', json.dumps(self.objects[:2]))
+            # Загруженные куски уже зафиксированы, их откатывает тест.
+            transaction.set_rollback(True)
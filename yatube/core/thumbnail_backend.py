@@ -0,0 +1,16 @@
+from sorl.thumbnail.base import EXTENSIONS
+from sorl.thumbnail.base import ThumbnailBackend as BaseThumbnailBackend
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.helpers import serialize, tokey
+
+
+class ThumbnailBackend(BaseThumbnailBackend):
+    """Бэкенд sorl-thumbnail, который знает расширение AVIF."""
+
+    extensions = dict(EXTENSIONS, AVIF='avif')
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        key = tokey(source.key, geometry_string, serialize(options))
+        path = f'{key[:2]}/{key[2:4]}/{key}'
+        extension = self.extensions[options['format']]
+        return f'{settings.THUMBNAIL_PREFIX}{path}.{extension}'
@@ -0,0 +1,125 @@
+import threading
+from contextlib import contextmanager
+from math import ceil
+
+from PIL import Image
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.engines.pil_engine import Engine as PILEngine
+from sorl.thumbnail.helpers import toint
+from sorl.thumbnail.parsers import parse_crop, parse_geometry
+
+# Во сколько раз картинка должна остаться больше цели после reduce(),
+# чтобы LANCZOS не потерял в качестве.
+REDUCING_GAP = 2
+
+
+class CompatEngine(PILEngine):
+    """PIL-движок sorl-thumbnail, совместимый с Pillow 10.
+
+    В Pillow 10 убрана константа Image.ANTIALIAS, на которую опирается
+    sorl-thumbnail 12.7; тот же фильтр называется Image.LANCZOS.
+    """
+
+    def _scale(self, image, width, height):
+        return image.resize((width, height), resample=Image.LANCZOS)
+
+
+class Engine(CompatEngine):
+    """Движок, который не декодирует и не ресемплирует лишнего.
+
+    JPEG декодируется сразу в уменьшенном масштабе через draft(), затем
+    картинка сжимается целым множителем через reduce() и только после
+    этого ресемплируется, причём лишь та область, что попадёт
+    в обрезку. Внутри decoded_once() источник декодируется один раз
+    на все запрошенные размеры.
+    """
+
+    _local = threading.local()
+
+    def _draft_size(self, image, geometry, options):
+        """Наименьший размер декодирования, которого хватит для
+        миниатюры, или None, если уменьшать нельзя.
+        """
+        x_image, y_image = image.size
+        width, height = geometry
+        # Поворот по EXIF применяется после декодирования.
+        if settings.THUMBNAIL_ORIENTATION and self._flip_dimensions(image):
+            width, height = height, width
+        factors = (width / x_image, height / y_image)
+        factor = max(factors) if options.get('crop') else min(factors)
+        if factor >= 1:
+            return None
+        return ceil(x_image * factor), ceil(y_image * factor)
+
+    def _draft(self, image, sizes):
+        if image.format != 'JPEG' or not sizes or None in sizes:
+            return
+        image.draft(image.mode, (max(size[0] for size in sizes),
+                                 max(size[1] for size in sizes)))
+
+    def _scale_region(self, image, size, box):
+        """Сжимает до `size` только область `box` картинки."""
+        left, top, right, bottom = box
+        factor = int(min((right - left) / size[0],
+                         (bottom - top) / size[1]) / REDUCING_GAP)
+        if factor >= 2:
+            image = image.reduce(factor, box=(
+                int(left), int(top), ceil(right), ceil(bottom)
+            ))
+            box = None
+        return image.resize(size, resample=Image.LANCZOS, box=box)
+
+    def _scale(self, image, width, height):
+        return self._scale_region(image, (width, height), (0, 0) + image.size)
+
+    def create(self, image, geometry, options):
+        if not options.get('cropbox'):
+            self._draft(image, [self._draft_size(image, geometry, options)])
+        return super().create(image, geometry, options)
+
+    def scale(self, image, geometry, options):
+        crop = options['crop']
+        if (not crop or crop in ('noop', 'smart')
+                or self.flip_dimensions(image)):
+            return super().scale(image, geometry, options)
+        x_image, y_image = map(float, self.get_image_size(image))
+        factor = self._calculate_scaling_factor(x_image, y_image, geometry,
+                                                options)
+        if factor >= 1 and not options['upscale']:
+            return image
+        width, height = toint(x_image * factor), toint(y_image * factor)
+        size = (min(width, geometry[0]), min(height, geometry[1]))
+        x_offset, y_offset = parse_crop(crop, (width, height), size)
+        return self._scale_region(image, size, (
+            x_offset / factor, y_offset / factor,
+            (x_offset + size[0]) / factor, (y_offset + size[1]) / factor,
+        ))
+
+    def get_image(self, source):
+        decoded = getattr(self._local, 'decoded', None)
+        if decoded is not None and decoded[0] == source.key:
+            return decoded[1].copy()
+        return super().get_image(source)
+
+    @contextmanager
+    def decoded_once(self, source, sizes):
+        """Декодирует источник один раз для всех размеров `sizes` —
+        пар (геометрия, опции), как в THUMBNAIL_SIZES.
+
+        Пока контекст открыт, get_image() этого источника в том же
+        потоке отдаёт копию уже декодированной картинки.
+        """
+        image = super().get_image(source)
+        ratio = image.size[0] / image.size[1]
+        self._draft(image, [
+            self._draft_size(image, parse_geometry(geometry, ratio), options)
+            for geometry, options in sizes
+        ])
+        if settings.THUMBNAIL_ORIENTATION:
+            image = self._orientation(image)
+        image.load()
+        self._local.decoded = (source.key, image)
+        try:
+            yield image
+        finally:
+            self._local.decoded = None
@@ -0,0 +1,39 @@
+from sorl.thumbnail.conf import settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore as CachedDBStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class KVStore(CachedDBStore):
+    """Хранилище sorl-thumbnail в кэше и базе с пакетным чтением.
+
+    get_many читает ключи одним get_many из кэша, а промахи — одним
+    запросом к базе, вместо отдельного чтения на каждую картинку.
+    """
+
+    def _get_many_raw(self, keys):
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = dict(KVStoreModel.objects.filter(
+                key__in=missing
+            ).values_list('key', 'value'))
+            # Отсутствие тоже кэшируется, как в _get_raw.
+            fetched = {key: found.get(key, EMPTY_VALUE) for key in missing}
+            self.cache.set_many(fetched, settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(fetched)
+        return {
+            key: value for key, value in values.items()
+            if value != EMPTY_VALUE
+        }
+
+    def get_many(self, image_files):
+        """Сохранённые ImageFile по списку файлов, None для отсутствующих."""
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        values = self._get_many_raw(keys)
+        return [
+            deserialize_image_file(values[key]) if values.get(key) else None
+            for key in keys
+        ]
@@ -0,0 +1,103 @@
+import warnings
+from functools import wraps
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.template.defaultfilters import filesizeformat
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from PIL import Image
+
+# Сколько первых байт файла хватает Pillow, чтобы прочитать заголовок
+# с форматом и размером, включая EXIF и ICC-профили JPEG.
+IMAGE_HEADER_BYTES = 256 * 1024
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Проверяет загружаемые картинки, пока тело запроса ещё читается.
+
+    Поля перед файлом, включая CSRF-токен, читаются как обычно,
+    слишком большой файл отклоняется, как только превышен лимит.
+    Формат и число пикселей берутся из заголовка картинки, без
+    декодирования. Причины отказа складываются в request.upload_errors,
+    а чтение запроса прекращается.
+    """
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.header = b''
+        self.checked = False
+        if (self.content_length is not None
+                and self.content_length > settings.IMAGE_UPLOAD_MAX_BYTES):
+            self.reject_size()
+
+    def reject(self, message, stop=True):
+        self.request.upload_errors[self.field_name] = message
+        if stop:
+            raise StopUpload(connection_reset=True)
+
+    def reject_size(self):
+        self.reject(f'Файл больше '
+                    f'{filesizeformat(settings.IMAGE_UPLOAD_MAX_BYTES)}.')
+
+    def sniff(self, final, stop=True):
+        """Проверяет заголовок; False, если его ещё не хватает."""
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', Image.DecompressionBombWarning)
+                with Image.open(BytesIO(self.header)) as image:
+                    format_, (width, height) = image.format, image.size
+        except Image.DecompressionBombError:
+            format_, width, height = None, 0, float('inf')
+        except Exception:
+            if final:
+                self.reject('Загрузите правильное изображение.', stop)
+            return False
+        if format_ is not None and (
+            format_ not in settings.IMAGE_UPLOAD_FORMATS
+        ):
+            self.reject(f'Формат {format_} не поддерживается.', stop)
+        elif width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+            self.reject('Слишком много пикселей в изображении.', stop)
+        return True
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.reject_size()
+        if not self.checked:
+            self.header += raw_data[:IMAGE_HEADER_BYTES - len(self.header)]
+            self.checked = self.sniff(
+                final=len(self.header) >= IMAGE_HEADER_BYTES
+            )
+        return raw_data
+
+    def file_complete(self, file_size):
+        if not self.checked:
+            # Файл короче заголовка, дочитан целиком; останавливать
+            # уже нечего, ошибка просто ляжет в форму.
+            self.sniff(final=True, stop=False)
+        return None
+
+
+def stream_image_uploads(view):
+    """Подключает ImageUploadHandler к представлению.
+
+    Обработчики загрузки нельзя поменять после того, как CSRF-проверка
+    прочитала request.POST, поэтому проверка CSRF переносится внутрь.
+    """
+    protected = csrf_protect(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        request.upload_errors = {}
+        request.upload_handlers.insert(0, ImageUploadHandler(request))
+        return protected(request, *args, **kwargs)
+
+    return csrf_exempt(wrapper)
+
+
+def add_upload_errors(form, request):
+    """Переносит причины отказа в загрузке в ошибки формы."""
+    for field_name, message in getattr(request, 'upload_errors', {}).items():
+        form.add_error(field_name if field_name in form.fields else None,
+                       message)
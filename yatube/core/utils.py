@@ -1,7 +1,228 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+from math import ceil
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 
-def posts_paginator(request, post_list, number_posts):
-    paginator = Paginator(post_list, number_posts)
+
+def count_cache_key(*parts):
+    """Ключ кэша для числа записей, например ('group', 5)."""
+    return ':'.join(['count'] + [str(part) for part in parts])
+
+
+def expire_counts(keys):
+    """Удаляет закэшированные числа записей вместе с отметками, что
+    записей больше порога: следующий запрос посчитает их заново.
+    """
+    keys = list(keys)
+    cache.delete_many(keys + [f'{key}:many' for key in keys])
+
+
+def cached_count(queryset, count_key=None):
+    """Число записей в выборке.
+
+    Берётся из кэша, который поддерживают сигналы создания и удаления
+    постов. При промахе считается с ограничением сверху: если записей
+    больше PAGINATOR_EXACT_COUNT_LIMIT, возвращается None, и это тоже
+    запоминается, чтобы не повторять COUNT на каждом запросе.
+    """
+    timeout = settings.PAGINATOR_COUNT_CACHE_TIMEOUT
+    if count_key is not None:
+        cached = cache.get_many([count_key, f'{count_key}:many'])
+        if count_key in cached:
+            return cached[count_key]
+        if cached:
+            return None
+    limit = settings.PAGINATOR_EXACT_COUNT_LIMIT
+    count = queryset.order_by()[:limit + 1].count()
+    if count > limit:
+        if count_key is not None:
+            cache.set(f'{count_key}:many', True, timeout)
+        return None
+    if count_key is not None:
+        cache.set(count_key, count, timeout)
+    return count
+
+
+class CountingPaginator(Paginator):
+    """Паджинатор с кэшированным и приблизительным числом записей.
+
+    Если записей больше порога, `approximate` становится True, а `count`
+    показывает нижнюю оценку, которая уточняется по мере листания.
+    """
+
+    def __init__(self, object_list, per_page, count_key=None):
+        super().__init__(object_list, per_page)
+        self.count_key = count_key
+        self.exact_count = cached_count(object_list, count_key)
+        self.approximate = self.exact_count is None
+        self._seen = 0
+
+    @property
+    def count(self):
+        if self.approximate:
+            return max(settings.PAGINATOR_EXACT_COUNT_LIMIT + 1, self._seen)
+        return self.exact_count
+
+    @property
+    def num_pages(self):
+        return max(1, ceil(self.count / self.per_page))
+
+    def validate_number(self, number):
+        if not self.approximate:
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        if not self.approximate:
+            return super().page(number)
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('That page contains no results')
+        self._seen = bottom + len(rows)
+        return self._get_page(rows[:self.per_page], number, self)
+
+    def get_page(self, number):
+        """Как Paginator.get_page, но номер за концом приблизительной
+        ленты тоже открывает последнюю страницу.
+
+        Такой номер выясняется только по пустой выборке; тогда записи
+        считаются точно, а число запоминается в кэше, где его дальше
+        поддерживают сигналы.
+        """
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            self.exact_count = self.object_list.count()
+            self.approximate = False
+            if self.count_key is not None:
+                cache.set(self.count_key, self.exact_count,
+                          settings.PAGINATOR_COUNT_CACHE_TIMEOUT)
+            return super().get_page(self.num_pages)
+
+
+def seek(queryset, cursor, newer, limit, date_field='pub_date',
+         pk_field='pk'):
+    """До `limit` записей за курсором (дата, id).
+
+    Записи новее курсора возвращаются по возрастанию ключа,
+    старее — по убыванию, как в ленте.
+    """
+    if newer:
+        order, lookup = (date_field, pk_field), 'gt'
+    else:
+        order, lookup = (f'-{date_field}', f'-{pk_field}'), 'lt'
+    if cursor is not None:
+        date, pk = cursor
+        queryset = queryset.filter(
+            Q(**{f'{date_field}__{lookup}': date})
+            | Q(**{date_field: date, f'{pk_field}__{lookup}': pk})
+        )
+    return list(queryset.order_by(*order)[:limit])
+
+
+class CursorPaginator(Paginator):
+    """Паджинатор по ключу (дата, id) без COUNT(*) и OFFSET.
+
+    Стоимость страницы не зависит от того, насколько далеко
+    пользователь пролистал ленту. Номер страницы условный: 1 для
+    начала ленты и 2 для любой следующей, курсоры на соседние
+    страницы лежат в `next_cursor` и `previous_cursor`.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, date_field='pub_date',
+                 pk_field='pk'):
+        super().__init__(object_list, per_page)
+        self.date_field = date_field
+        self.pk_field = pk_field
+        self.number = 1
+        self.has_next = False
+        self.next_cursor = ''
+        self.previous_cursor = ''
+
+    @property
+    def num_pages(self):
+        return self.number + int(self.has_next)
+
+    def encode_cursor(self, obj):
+        date = getattr(obj, self.date_field).isoformat()
+        value = f'{date}|{getattr(obj, self.pk_field)}'
+        return base64.urlsafe_b64encode(value.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(token):
+        """(дата, id) из курсора или None, если он пуст или испорчен."""
+        if not token:
+            return None
+        try:
+            padded = token + '=' * (-len(token) % 4)
+            value = base64.urlsafe_b64decode(padded.encode()).decode()
+            date, pk = value.rsplit('|', 1)
+            date = parse_datetime(date)
+            pk = int(pk)
+        except (binascii.Error, UnicodeError, ValueError):
+            return None
+        if date is None:
+            return None
+        return date, pk
+
+    def _fetch(self, cursor, newer, limit):
+        return seek(self.object_list, cursor, newer, limit,
+                    self.date_field, self.pk_field)
+
+    def _build_page(self, rows, has_next, has_previous):
+        self.number = 2 if has_previous else 1
+        self.has_next = has_next
+        if rows and has_next:
+            self.next_cursor = self.encode_cursor(rows[-1])
+        if rows and has_previous:
+            self.previous_cursor = self.encode_cursor(rows[0])
+        return self._get_page(rows, self.number, self)
+
+    def get_page(self, after=None, before=None):
+        """Страница постов старше `after` или новее `before`."""
+        limit = self.per_page + 1
+        before_cursor = self.decode_cursor(before)
+        after_cursor = self.decode_cursor(after)
+        if before_cursor is not None:
+            rows = self._fetch(before_cursor, True, limit)
+            if len(rows) > self.per_page:
+                return self._build_page(rows[:self.per_page][::-1], True, True)
+            after_cursor = None
+        rows = self._fetch(after_cursor, False, limit)
+        has_next = len(rows) > self.per_page
+        return self._build_page(
+            rows[:self.per_page], has_next, after_cursor is not None
+        )
+
+
+def posts_paginator(request, post_list, number_posts, count_key=None,
+                    cursor_paginator=None):
+    """Страница ленты: по курсору или, если передан ?page=N, по номеру.
+
+    `cursor_paginator` заменяет курсорный паджинатор по умолчанию,
+    например для ленты, собранной из нескольких источников.
+    """
     page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+    if page_number is not None:
+        paginator = CountingPaginator(post_list, number_posts, count_key)
+        return paginator.get_page(page_number)
+    paginator = cursor_paginator or CursorPaginator(post_list, number_posts)
+    return paginator.get_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Post, Group
+from .models import Group, MediaFile, Post
+from .search import filter_matching, fts_available, match_expression
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +10,21 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not fts_available():
+            return super().get_search_results(request, queryset,
+                                              search_term)
+        if not match_expression(search_term):
+            return queryset.none(), False
+        return filter_matching(queryset, search_term), False
+
+
+class MediaFileAdmin(admin.ModelAdmin):
+    list_display = ('name', 'refs', 'released',)
+    search_fields = ('name',)
+    readonly_fields = ('name', 'refs', 'released',)
+
 
 admin.site.register(Post, PostAdmin)
+admin.site.register(MediaFile, MediaFileAdmin)
 admin.site.register(Group)
@@ -0,0 +1,141 @@
+"""Замеры скорости ленты, групп, профиля, поста и подписок.
+
+Страницы открываются тестовым клиентом Django от имени читателя
+на сгенерированных данных: на холодном кэше перед каждым запросом
+кэш очищается, на тёплом страница один раз открывается заранее.
+"""
+import json
+import math
+import time
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Group, Post, User
+
+VIEWS = {
+    'posts:index': (),
+    'posts:group_list': ('slug',),
+    'posts:profile': ('username',),
+    'posts:post_detail': ('post_id',),
+    'posts:follow_index': (),
+}
+SCENARIOS = ('cold', 'warm')
+
+
+def pick_targets():
+    """Читатель и параметры страниц: самые тяжёлые группа, автор
+    и пост и читатель с наибольшим числом подписок.
+    """
+    reader = User.objects.order_by('-stats__following_count', 'pk').first()
+    author = User.objects.order_by('-stats__posts_count', 'pk').first()
+    group = Group.objects.order_by('-posts_count', 'pk').first()
+    post = Post.objects.order_by('-comments_count', 'pk').first()
+    if None in (reader, group, post):
+        raise ValueError('Для замеров нужны пользователи, группы и посты')
+    return reader, {
+        'slug': group.slug,
+        'username': author.username,
+        'post_id': post.pk,
+    }
+
+
+def percentile(samples, fraction):
+    """Процентиль по ближайшему рангу: значение, не меньше которого
+    доля `fraction` замеров.
+    """
+    ordered = sorted(samples)
+    return ordered[max(math.ceil(fraction * len(ordered)), 1) - 1]
+
+
+def measure_view(client, url, requests, warm):
+    """Время, запросы к базе и размер ответа `requests` открытий `url`."""
+    if warm:
+        client.get(url)
+    durations, queries, sizes = [], [], []
+    for _ in range(requests):
+        if not warm:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = client.get(url)
+            durations.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise ValueError(f'{url} ответил {response.status_code}')
+        queries.append(len(captured))
+        sizes.append(len(response.content))
+    return {
+        'p50_ms': round(percentile(durations, 0.5), 2),
+        'p95_ms': round(percentile(durations, 0.95), 2),
+        'p99_ms': round(percentile(durations, 0.99), 2),
+        'mean_ms': round(sum(durations) / requests, 2),
+        'queries': round(sum(queries) / requests, 2),
+        'bytes': round(sum(sizes) / requests),
+    }
+
+
+def run_benchmark(requests=50, scenarios=SCENARIOS, views=VIEWS):
+    """Возвращает {сценарий: {страница: замеры}}."""
+    reader, values = pick_targets()
+    client = Client()
+    client.force_login(reader)
+    results = {}
+    for scenario in scenarios:
+        cache.clear()
+        results[scenario] = {
+            name: measure_view(
+                client,
+                reverse(name, kwargs={param: values[param]
+                                      for param in params}),
+                requests, scenario == 'warm',
+            )
+            for name, params in views.items()
+        }
+    return results
+
+
+def load_report(path):
+    with open(path, encoding='utf-8') as report:
+        return json.load(report)
+
+
+def save_report(report, path):
+    with open(path, 'w', encoding='utf-8') as output:
+        json.dump(report, output, indent=4, sort_keys=True)
+        output.write('\n')
+
+
+def _change(now, before):
+    if before is None:
+        return 'new'
+    if not before:
+        return '-'
+    return f'{(now - before) / before * 100:+.0f}%'
+
+
+def results_table(results, baseline=None):
+    """Таблица замеров; с `baseline` — изменение p50 и p95 против него."""
+    header = ['scenario', 'view', 'p50', 'p95', 'p99', 'queries', 'bytes']
+    if baseline is not None:
+        header += ['p50 diff', 'p95 diff']
+    rows = []
+    for scenario, views in results.items():
+        for name, stats in views.items():
+            row = [scenario, name, f"{stats['p50_ms']:.1f}",
+                   f"{stats['p95_ms']:.1f}", f"{stats['p99_ms']:.1f}",
+                   f"{stats['queries']:g}", stats['bytes']]
+            if baseline is not None:
+                before = baseline.get(scenario, {}).get(name, {})
+                row += [_change(stats['p50_ms'], before.get('p50_ms')),
+                        _change(stats['p95_ms'], before.get('p95_ms'))]
+            rows.append(row)
+    widths = [max(len(str(row[column])) for row in [header] + rows)
+              for column in range(len(header))]
+    lines = ['  '.join(str(value).ljust(width)
+                       for value, width in zip(row, widths))
+             for row in [header] + rows]
+    lines.insert(1, '  '.join('-' * width for width in widths))
+    return '\n'.join(lines)
@@ -0,0 +1,77 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .thumbnails import post_picture, ready_thumbnails
+
+CARD_TEMPLATE = 'posts/includes/post_list.html'
+
+
+def version_key(kind, pk):
+    return f'card_version:{kind}:{pk}'
+
+
+def bump_card_version(kind, pk):
+    """Делает устаревшими карточки, зависящие от поста, автора
+    или группы.
+    """
+    cache.set(version_key(kind, pk), uuid4().hex, None)
+
+
+def card_version_keys(post):
+    keys = [version_key('post', post.pk), version_key('user', post.author_id)]
+    if post.group_id is not None:
+        keys.append(version_key('group', post.group_id))
+    return keys
+
+
+def card_keys(posts):
+    """Ключи кэша карточек с учётом версий поста, автора и группы.
+
+    Версия, которой нет в кэше, заводится заново, поэтому вытесненная
+    версия не может вернуть старую карточку.
+    """
+    wanted = {key for post in posts for key in card_version_keys(post)}
+    versions = cache.get_many(wanted)
+    fresh = {key: uuid4().hex for key in wanted - versions.keys()}
+    if fresh:
+        cache.set_many(fresh, None)
+        versions.update(fresh)
+    return [
+        'card:{}:{}'.format(
+            post.pk,
+            ':'.join(versions[key] for key in card_version_keys(post)),
+        )
+        for post in posts
+    ]
+
+
+def render_cards(posts):
+    """Список HTML карточек постов, по возможности из кэша.
+
+    Миниатюры для карточек, которых нет в кэше, читаются из хранилища
+    sorl-thumbnail одним пакетом на страницу.
+    """
+    posts = list(posts)
+    keys = card_keys(posts)
+    cached = cache.get_many(keys)
+    thumbnails = ready_thumbnails(
+        [post for post, key in zip(posts, keys) if key not in cached]
+    )
+    rendered = {}
+    cards = []
+    for post, key in zip(posts, keys):
+        card = cached.get(key)
+        if card is None:
+            card = render_to_string(CARD_TEMPLATE, {
+                'post': post,
+                'picture': post_picture(post, thumbnails.get(post.pk, {})),
+            })
+            rendered[key] = card
+        cards.append(mark_safe(card))
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+    return cards
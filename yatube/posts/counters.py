@@ -0,0 +1,135 @@
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+
+def _shifted(deltas):
+    return {
+        field: Greatest(F(field) + delta, Value(0))
+        for field, delta in deltas.items()
+    }
+
+
+def _grouped_counts(manager, key, pks, field):
+    actual = {pk: {field: 0} for pk in pks}
+    rows = manager.filter(**{f'{key}__in': pks}).order_by().values(
+        key
+    ).annotate(total=Count('pk')).values_list(key, 'total')
+    for pk, total in rows:
+        actual[pk][field] = total
+    return actual
+
+
+def count_user_stats(user_ids):
+    """Настоящие значения счётчиков пользователей по данным в базе."""
+    stats = {pk: {} for pk in user_ids}
+    queries = (
+        ('posts_count', Post.objects, 'author_id'),
+        ('followers_count', Follow.objects, 'author_id'),
+        ('following_count', Follow.objects, 'user_id'),
+    )
+    for field, manager, key in queries:
+        counts = _grouped_counts(manager, key, user_ids, field)
+        for pk, values in counts.items():
+            stats[pk].update(values)
+    return stats
+
+
+def get_user_stats(user_id):
+    """Счётчики пользователя; если строки ещё нет, она считается."""
+    stats, _ = UserStats.objects.get_or_create(
+        user_id=user_id, defaults=count_user_stats([user_id])[user_id]
+    )
+    return stats
+
+
+def user_stats(user):
+    """Счётчики пользователя, подгруженные select_related('stats')
+    или, если их ещё нет, посчитанные заново.
+    """
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return get_user_stats(user.pk)
+
+
+def shift_user_stats(user_id, **deltas):
+    """Атомарно сдвигает счётчики пользователя через F-выражения.
+
+    Если строки счётчиков нет, ничего не создаётся: её посчитают
+    user_stats() или reconcile_counters. Так удаление пользователя,
+    чья строка уже удалена каскадом, не заводит её заново.
+    """
+    UserStats.objects.filter(user_id=user_id).update(**_shifted(deltas))
+
+
+def shift_group_posts(group_id, delta):
+    if group_id is not None:
+        Group.objects.filter(pk=group_id).update(
+            **_shifted({'posts_count': delta})
+        )
+
+
+def shift_post_comments(post_id, delta):
+    if post_id is not None:
+        Post.objects.filter(pk=post_id).update(
+            **_shifted({'comments_count': delta})
+        )
+
+
+def _repair(model, field_names, actual, dry_run):
+    rows = list(model.objects.only(*field_names).filter(pk__in=actual))
+    drifted = [
+        row for row in rows
+        if any(getattr(row, name) != actual[row.pk][name]
+               for name in field_names)
+    ]
+    for row in drifted:
+        for name in field_names:
+            setattr(row, name, actual[row.pk][name])
+    if drifted and not dry_run:
+        model.objects.bulk_update(drifted, field_names)
+    return len(drifted)
+
+
+def _batches(queryset, batch_size):
+    last_pk = None
+    while True:
+        batch = queryset.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return
+        yield pks
+        last_pk = pks[-1]
+
+
+def reconcile_counters(batch_size=1000, dry_run=False):
+    """Сверяет счётчики с данными пачками по первичному ключу
+    и возвращает, сколько строк каждой модели было исправлено.
+    """
+    repaired = {'groups': 0, 'posts': 0, 'users': 0}
+    for pks in _batches(Group.objects.all(), batch_size):
+        actual = _grouped_counts(Post.objects, 'group_id', pks, 'posts_count')
+        repaired['groups'] += _repair(Group, ['posts_count'], actual,
+                                      dry_run)
+    for pks in _batches(Post.objects.all(), batch_size):
+        actual = _grouped_counts(Comment.objects, 'post_id', pks,
+                                 'comments_count')
+        repaired['posts'] += _repair(Post, ['comments_count'], actual,
+                                     dry_run)
+    fields = ['posts_count', 'followers_count', 'following_count']
+    for pks in _batches(User.objects.all(), batch_size):
+        actual = count_user_stats(pks)
+        missing = set(pks) - set(UserStats.objects.filter(
+            user_id__in=pks
+        ).values_list('user_id', flat=True))
+        if missing and not dry_run:
+            UserStats.objects.bulk_create(
+                [UserStats(user_id=pk, **actual[pk]) for pk in missing]
+            )
+        repaired['users'] += len(missing) + _repair(UserStats, fields,
+                                                    actual, dry_run)
+    return repaired
@@ -0,0 +1,257 @@
+import random
+import time
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from faker import Faker
+from PIL import Image, ImageDraw
+
+from core.bulkload import insert_raw, reset_sequences
+from core.pagecache import bump_page_version
+from core.utils import count_cache_key, expire_counts
+from .counters import reconcile_counters
+from .models import Comment, Follow, Group, MediaFile, Post, User
+from .timeline import rebuild_timelines
+
+PRESETS = {
+    'small': {'users': 100, 'groups': 5, 'posts': 2000,
+              'comments': 4000, 'follows': 1000},
+    'medium': {'users': 5000, 'groups': 50, 'posts': 100000,
+               'comments': 200000, 'follows': 50000},
+    'large': {'users': 50000, 'groups': 200, 'posts': 1000000,
+              'comments': 2000000, 'follows': 1000000},
+}
+
+# Показатель степени в законе Ципфа: популярность автора с номером r
+# пропорциональна 1 / r ** ZIPF_EXPONENT.
+ZIPF_EXPONENT = 1.1
+# За сколько дней до сегодняшнего дня распределяются посты.
+DATASET_DAYS = 365
+# Сколько разных картинок получат посты с картинками.
+IMAGE_POOL_SIZE = 20
+# Сколько строк вставлять одним INSERT.
+BATCH_SIZE = 500
+
+
+def zipf_rank(rng, count, exponent=ZIPF_EXPONENT):
+    """Номер от 0 до count - 1, где номер r выпадает с вероятностью
+    примерно 1 / (r + 1) ** exponent.
+
+    Непрерывное приближение через обратную функцию распределения:
+    не нужно хранить веса всех номеров.
+    """
+    if exponent == 1:
+        value = count ** rng.random()
+    else:
+        power = 1 - exponent
+        value = ((count ** power - 1) * rng.random() + 1) ** (1 / power)
+    return min(int(value), count) - 1
+
+
+def _scatter(rank, count):
+    """Перемешивает номера без таблицы: популярными оказываются
+    не подряд идущие записи.
+    """
+    step = 7919
+    while count % step == 0:
+        step += 2
+    return rank * step % count
+
+
+def _next_pk(model):
+    return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+
+def _images(rng, count, size=(1200, 800)):
+    """Картинки для постов: градиент с кругами, как фото по объёму."""
+    storage = Post._meta.get_field('image').storage
+    names = []
+    for _ in range(count):
+        image = Image.merge('RGB', [
+            Image.linear_gradient('L').rotate(rng.randrange(360)).resize(size)
+            for _ in range(3)
+        ])
+        draw = ImageDraw.Draw(image)
+        for _ in range(10):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            radius = rng.randrange(20, size[1] // 3)
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        content = BytesIO()
+        image.save(content, 'JPEG', quality=85)
+        names.append(storage.save('posts/synthetic.jpg',
+                                  ContentFile(content.getvalue())))
+    return names
+
+
+class DatasetGenerator:
+    """Синтетические пользователи, группы, посты, комментарии и подписки.
+
+    Одинаковое зерно даёт одинаковые данные, кроме дат: они
+    отсчитываются от начала текущего дня. Авторы постов и подписок
+    выбираются по закону Ципфа, так что у немногих авторов большая
+    часть постов и подписчиков, как в настоящих соцсетях.
+    """
+
+    def __init__(self, seed=0, images=0.0, progress=None):
+        self.rng = random.Random(seed)
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(seed)
+        self.images = images
+        self.progress = progress
+        self.end = timezone.now().replace(hour=0, minute=0, second=0,
+                                          microsecond=0)
+
+    def _insert(self, model, objects):
+        start = time.perf_counter()
+        count = 0
+        batch = []
+        with transaction.atomic():
+            for obj in objects:
+                batch.append(obj)
+                if len(batch) >= BATCH_SIZE:
+                    insert_raw(model, batch, BATCH_SIZE)
+                    count += len(batch)
+                    batch = []
+            insert_raw(model, batch, BATCH_SIZE)
+            count += len(batch)
+        if self.progress is not None:
+            self.progress(model, count, time.perf_counter() - start)
+        return count
+
+    def users(self, count):
+        self.first_user = _next_pk(User)
+        password = make_password(None)
+        for number in range(count):
+            pk = self.first_user + number
+            profile = self.fake.simple_profile()
+            first_name, _, last_name = profile['name'].partition(' ')
+            yield User(
+                pk=pk, username=f'{profile["username"]}{pk}',
+                email=f'user{pk}@example.com', password=password,
+                first_name=first_name[:30], last_name=last_name[:150],
+                date_joined=self.end - timedelta(days=DATASET_DAYS),
+            )
+
+    def groups(self, count):
+        self.first_group = _next_pk(Group)
+        for number in range(count):
+            pk = self.first_group + number
+            yield Group(
+                pk=pk, slug=f'group-{pk}',
+                title=self.fake.sentence(nb_words=3)[:200].rstrip('.'),
+                description=self.fake.paragraph(),
+            )
+
+    def post_date(self, number):
+        """Дата поста по его номеру: чем больше номер, тем новее."""
+        span = timedelta(days=DATASET_DAYS).total_seconds()
+        return self.end - timedelta(
+            seconds=span * (self.posts_count - number) / self.posts_count
+        )
+
+    def posts(self, count):
+        self.first_post = _next_pk(Post)
+        self.posts_count = count
+        pool = _images(self.rng, IMAGE_POOL_SIZE) if self.images else []
+        self.image_refs = dict.fromkeys(pool, 0)
+        for number in range(count):
+            author = zipf_rank(self.rng, self.users_count)
+            group = None
+            if self.groups_count and self.rng.random() < 0.7:
+                group = self.first_group + zipf_rank(self.rng,
+                                                     self.groups_count)
+            image = ''
+            if pool and self.rng.random() < self.images:
+                image = self.rng.choice(pool)
+                self.image_refs[image] += 1
+            yield Post(
+                pk=self.first_post + number,
+                author_id=self.first_user + author, group_id=group,
+                text=self.fake.text(max_nb_chars=self.rng.choice(
+                    (80, 200, 600)
+                )),
+                pub_date=self.post_date(number), image=image,
+            )
+
+    def comments(self, count):
+        first = _next_pk(Comment)
+        for number in range(count):
+            post = _scatter(zipf_rank(self.rng, self.posts_count),
+                            self.posts_count)
+            created = min(
+                self.post_date(post)
+                + timedelta(minutes=self.rng.randrange(60 * 24 * 3)),
+                self.end,
+            )
+            yield Comment(
+                pk=first + number, post_id=self.first_post + post,
+                author_id=self.first_user
+                + self.rng.randrange(self.users_count),
+                text=self.fake.sentence(nb_words=self.rng.randrange(3, 20)),
+                created=created,
+            )
+
+    def follows(self, count):
+        """Подписки без повторов и на самого себя: читатель выбирается
+        равномерно, автор — по закону Ципфа.
+        """
+        users = self.users_count
+        count = min(count, users * (users - 1))
+        first = _next_pk(Follow)
+        pairs = set()
+        attempts = 0
+        while len(pairs) < count and attempts < count * 20:
+            attempts += 1
+            user = self.rng.randrange(users)
+            author = zipf_rank(self.rng, users)
+            if user == author or (user, author) in pairs:
+                continue
+            pairs.add((user, author))
+            yield Follow(pk=first + len(pairs) - 1,
+                         user_id=self.first_user + user,
+                         author_id=self.first_user + author)
+
+    def generate(self, users, groups, posts, comments, follows):
+        """Создаёт данные и возвращает {модель: число строк}.
+
+        Записи вставляются пачками с заданными pk и без сигналов,
+        поэтому в конце сдвигаются последовательности pk,
+        пересчитываются счётчики, ленты подписок и ссылки на картинки
+        и сбрасываются закэшированные числа постов и страницы.
+        """
+        if users < 1:
+            raise ValueError('Нужен хотя бы один пользователь')
+        self.users_count = users
+        self.groups_count = groups
+        counts = {User: self._insert(User, self.users(self.users_count)),
+                  Group: self._insert(Group, self.groups(groups))}
+        counts[Post] = self._insert(Post, self.posts(posts))
+        counts[Comment] = (self._insert(Comment, self.comments(comments))
+                           if posts else 0)
+        counts[Follow] = self._insert(Follow, self.follows(follows))
+        reset_sequences(list(counts))
+        for name, refs in self.image_refs.items():
+            if refs and not MediaFile.objects.filter(name=name).update(
+                refs=F('refs') + refs, released=None
+            ):
+                MediaFile.objects.create(name=name, refs=refs)
+        reconcile_counters()
+        expire_counts([count_cache_key('posts')] + [
+            count_cache_key('group', pk) for pk in range(
+                self.first_group, self.first_group + self.groups_count
+            )
+        ])
+        last_user = self.first_user + self.users_count
+        for first in range(self.first_user, last_user, BATCH_SIZE):
+            users = range(first, min(first + BATCH_SIZE, last_user))
+            rebuild_timelines(users)
+            expire_counts(count_cache_key(kind, pk) for pk in users
+                          for kind in ('author', 'follow'))
+        bump_page_version()
+        return counts
@@ -0,0 +1,172 @@
+import csv
+import gzip
+import json
+import os
+from datetime import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, Follow, Post
+
+# Что выгружается: имя -> (модель, поле водяного знака, столбцы).
+# Инкрементальная выгрузка берёт строки, где поле больше знака.
+EXPORTS = {
+    'posts': (Post, 'pub_date', ('id', 'author_id', 'group_id', 'text',
+                                 'pub_date', 'image', 'comments_count')),
+    'comments': (Comment, 'created', ('id', 'post_id', 'author_id',
+                                      'text', 'created')),
+    'follows': (Follow, 'id', ('id', 'user_id', 'author_id')),
+}
+
+FORMATS = ('ndjson', 'csv', 'columnar')
+
+
+def _cell(value):
+    """Значение для файла; даты в ISO 8601 с микросекундами во всех
+    форматах, как у водяного знака.
+    """
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class NDJSONWriter:
+    """Строка таблицы — JSON-объект на строке файла."""
+    extension = 'ndjson'
+
+    def __init__(self, stream, columns, chunk_size):
+        self.stream = stream
+        self.columns = columns
+
+    def write(self, row):
+        self.stream.write(json.dumps(
+            {column: _cell(value) for column, value in zip(self.columns, row)},
+            ensure_ascii=False,
+        ) + '\n')
+
+    def close(self):
+        pass
+
+
+class CSVWriter:
+    """CSV с заголовком, даты в ISO 8601."""
+    extension = 'csv'
+
+    def __init__(self, stream, columns, chunk_size):
+        self.writer = csv.writer(stream)
+        self.writer.writerow(columns)
+
+    def write(self, row):
+        self.writer.writerow([_cell(value) for value in row])
+
+    def close(self):
+        pass
+
+
+class ColumnarWriter:
+    """Столбцы группами строк, как row group в Parquet.
+
+    Первая строка файла — {"columns": [...]}, каждая следующая —
+    {"rows": N, "data": {столбец: [значения]}} для `chunk_size` строк,
+    так что читатель может взять только нужные столбцы.
+    """
+    extension = 'columnar.ndjson'
+
+    def __init__(self, stream, columns, chunk_size):
+        self.stream = stream
+        self.columns = columns
+        self.chunk_size = chunk_size
+        self.stream.write(json.dumps({'columns': columns}) + '\n')
+        self.group = []
+
+    def flush(self):
+        if not self.group:
+            return
+        self.stream.write(json.dumps({
+            'rows': len(self.group),
+            'data': {
+                column: [_cell(row[index]) for row in self.group]
+                for index, column in enumerate(self.columns)
+            },
+        }, ensure_ascii=False) + '\n')
+        self.group = []
+
+    def write(self, row):
+        self.group.append(row)
+        if len(self.group) >= self.chunk_size:
+            self.flush()
+
+    def close(self):
+        self.flush()
+
+
+WRITERS = {
+    'ndjson': NDJSONWriter,
+    'csv': CSVWriter,
+    'columnar': ColumnarWriter,
+}
+
+
+def parse_watermark(model, field_name, value):
+    """Водяной знак из строки: дата или число, как поле модели."""
+    if value is None:
+        return None
+    if model._meta.get_field(field_name).get_internal_type().endswith(
+        'DateTimeField'
+    ):
+        return parse_datetime(value)
+    return int(value)
+
+
+def format_watermark(value):
+    """Водяной знак для JSON-файла знаков."""
+    return str(_cell(value))
+
+
+def export_stamp():
+    """Метка выгрузки для имён файлов, например 20240131T020000123456Z."""
+    return timezone.now().strftime('%Y%m%dT%H%M%S%fZ')
+
+
+def export_table(name, directory, format_='ndjson', compress=False,
+                 since=None, chunk_size=2000, stamp=None):
+    """Выгружает таблицу `name` из EXPORTS в файл в `directory`.
+
+    Строки читаются через iterator(chunk_size) и сразу пишутся в файл,
+    поэтому память не зависит от размера таблицы. С `since` выгружаются
+    только строки, где поле водяного знака больше него. В имени файла
+    метка выгрузки `stamp`, так что инкрементальные выгрузки копятся
+    в одном каталоге; если новых строк нет, файл не пишется и путь
+    равен None. Файл появляется под своим именем, только когда записан
+    целиком. Возвращает путь, число строк и новый водяной знак (старый,
+    если строк нет).
+    """
+    model, field_name, columns = EXPORTS[name]
+    rows = model.objects.order_by(field_name, 'pk')
+    if since is not None:
+        rows = rows.filter(**{f'{field_name}__gt': since})
+    watermark_index = columns.index(field_name)
+    writer_class = WRITERS[format_]
+    path = os.path.join(
+        directory,
+        f'{name}.{stamp or export_stamp()}.{writer_class.extension}',
+    )
+    if compress:
+        path += '.gz'
+    partial = path + '.part'
+    opener = gzip.open if compress else open
+    count = 0
+    watermark = since
+    with opener(partial, 'wt', encoding='utf-8', newline='') as stream:
+        writer = writer_class(stream, columns, chunk_size)
+        for row in rows.values_list(*columns).iterator(chunk_size=chunk_size):
+            writer.write(row)
+            watermark = row[watermark_index]
+            count += 1
+        writer.close()
+    if not count and since is not None:
+        os.remove(partial)
+        return None, count, watermark
+    os.replace(partial, path)
+    return path, count, watermark
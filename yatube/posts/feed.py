@@ -0,0 +1,66 @@
+import heapq
+import logging
+
+from core.utils import CursorPaginator, seek
+from .models import Follow, Post, TimelineEntry
+from .timeline import pulled_authors
+
+logger = logging.getLogger(__name__)
+
+
+def _feed_key(post):
+    return post.pub_date, post.pk
+
+
+class FollowFeedPaginator(CursorPaginator):
+    """Лента подписок из материализованной ленты и постов популярных
+    авторов.
+
+    Посты авторов с числом подписчиков выше FEED_PUSH_FOLLOWER_LIMIT
+    не раскладываются по лентам при публикации: они читаются из Post
+    при показе и сливаются с лентой k-way слиянием по (pub_date, id).
+    Сколько авторов прочитано так и сколько пришло из ленты, лежит
+    в `stats` и пишется в лог `posts.feed`.
+    """
+
+    def __init__(self, user, per_page):
+        super().__init__(Post.objects.none(), per_page)
+        self.user = user
+        self.stats = {'pulled': 0, 'pushed': 0}
+        self._pulled = None
+
+    def pulled(self):
+        """Популярные авторы из подписок, один раз на запрос: при
+        листании назад _fetch может вызываться дважды.
+        """
+        if self._pulled is None:
+            followed = set(Follow.objects.filter(
+                user=self.user
+            ).values_list('author_id', flat=True))
+            self._pulled = pulled_authors(followed)
+            self.stats = {
+                'pulled': len(self._pulled),
+                'pushed': len(followed) - len(self._pulled),
+            }
+            logger.info('follow feed for user %s: pulled=%d pushed=%d',
+                        self.user.pk, self.stats['pulled'],
+                        self.stats['pushed'])
+        return self._pulled
+
+    def _fetch(self, cursor, newer, limit):
+        pulled = self.pulled()
+        timeline = TimelineEntry.objects.filter(
+            user=self.user
+        ).exclude(author_id__in=pulled).select_related(
+            'post__author', 'post__group'
+        )
+        streams = [[
+            entry.post
+            for entry in seek(timeline, cursor, newer, limit,
+                              pk_field='post_id')
+        ]]
+        for author_id in pulled:
+            posts = Post.objects.for_cards().filter(author_id=author_id)
+            streams.append(seek(posts, cursor, newer, limit))
+        merged = heapq.merge(*streams, key=_feed_key, reverse=not newer)
+        return [post for post, _ in zip(merged, range(limit))]
@@ -0,0 +1,121 @@
+import random
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageDraw
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.parsers import parse_geometry
+
+from core.thumbnail_engine import CompatEngine, Engine
+from posts.thumbnails import THUMBNAIL_SIZES
+
+
+def generate_corpus(directory, count, size, seed):
+    """JPEG-картинки размера `size` с градиентом и фигурами, как
+    снимки с телефона по объёму работы для декодера.
+    """
+    storage = FileSystemStorage(location=directory)
+    rng = random.Random(seed)
+    files = []
+    for number in range(count):
+        image = Image.merge('RGB', [
+            Image.linear_gradient('L').rotate(rng.randrange(360)).resize(size)
+            for _ in range(3)
+        ])
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            radius = rng.randrange(20, size[0] // 4)
+            draw.ellipse((x - radius, y - radius, x + radius, y + radius),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        name = f'photo_{number}.jpg'
+        image.save(storage.path(name), 'JPEG', quality=90)
+        files.append(ImageFile(name, storage))
+    return files
+
+
+@contextmanager
+def decoded_once(engine, source, sizes):
+    if isinstance(engine, Engine):
+        with engine.decoded_once(source, sizes):
+            yield
+    else:
+        yield
+
+
+def render(engine, source, sizes):
+    """Миниатюры всех размеров одной картинки, как их строит бэкенд."""
+    results = []
+    with decoded_once(engine, source, sizes):
+        for geometry, options in sizes:
+            options = dict(default.backend.default_options, **options)
+            image = engine.get_image(source)
+            ratio = engine.get_image_ratio(image, options)
+            thumbnail = engine.create(
+                image, parse_geometry(geometry, ratio), options
+            )
+            engine._get_raw_data(thumbnail, options['format'],
+                                 options['quality'],
+                                 image_info={})
+            results.append(thumbnail.size)
+    return results
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает скорость построения миниатюр стандартным '
+            'PIL-движком и движком с draft()/reduce().')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=10,
+                            help='Сколько картинок сгенерировать.')
+        parser.add_argument('--size', default='4032x3024',
+                            help='Размер картинок, по умолчанию как '
+                                 'у камеры телефона.')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Сколько раз прогнать корпус.')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        try:
+            size = tuple(int(side) for side in options['size'].split('x'))
+            width, height = size
+        except ValueError:
+            raise CommandError('Размер задаётся как ШИРИНАxВЫСОТА.')
+        sizes = list(THUMBNAIL_SIZES.values())
+        directory = tempfile.mkdtemp()
+        try:
+            files = generate_corpus(directory, options['images'], size,
+                                    options['seed'])
+            timings = {}
+            outputs = {}
+            for engine in (CompatEngine(), Engine()):
+                name = type(engine).__name__
+                best = None
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    outputs[name] = [render(engine, source, sizes)
+                                     for source in files]
+                    duration = time.perf_counter() - start
+                    best = duration if best is None else min(best, duration)
+                timings[name] = best
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+        if outputs['CompatEngine'] != outputs['Engine']:
+            raise CommandError('Движки построили миниатюры разных размеров.')
+        per_image = {name: timings[name] / len(files) * 1000
+                     for name in timings}
+        self.stdout.write(
+            f'{len(files)} картинок {width}x{height}, размеров миниатюр: '
+            f'{len(sizes)}, лучший из {options["repeat"]} прогонов'
+        )
+        for name, duration in per_image.items():
+            self.stdout.write(f'{name:<14}{duration:10.1f} мс на картинку')
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: '
+            f'{timings["CompatEngine"] / timings["Engine"]:.1f}x'
+        ))
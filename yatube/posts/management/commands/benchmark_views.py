@@ -0,0 +1,94 @@
+import shutil
+import subprocess
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+from django.utils import timezone
+
+from posts import benchmark
+from posts.dataset import PRESETS, DatasetGenerator
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку ленты, группы, профиля, поста и подписок '
+            'на тестовой базе со сгенерированными данными.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=PRESETS, default='small',
+                            help='Размер данных, как у generate_dataset.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--images', type=float, default=0.0,
+                            help='Доля постов с картинкой, от 0 до 1.')
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Сколько раз открыть каждую страницу в каждом сценарии.',
+        )
+        parser.add_argument('--scenario', choices=benchmark.SCENARIOS,
+                            action='append',
+                            help='Только этот сценарий; по умолчанию оба.')
+        parser.add_argument('--output', help='Записать замеры в JSON.')
+        parser.add_argument(
+            '--compare',
+            help='JSON прошлого прогона: показать изменение задержек.',
+        )
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('--requests должно быть больше 0')
+        if not 0 <= options['images'] <= 1:
+            raise CommandError('--images должно быть от 0 до 1')
+        baseline = None
+        if options['compare']:
+            try:
+                report = benchmark.load_report(options['compare'])
+                baseline = report['results']
+            except (OSError, ValueError, KeyError) as error:
+                raise CommandError(f'Не читается {options["compare"]}: '
+                                   f'{error}')
+        setup_test_environment(debug=False)
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0)
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root):
+                generator = DatasetGenerator(options['seed'],
+                                             options['images'])
+                counts = generator.generate(**PRESETS[options['preset']])
+                results = benchmark.run_benchmark(
+                    options['requests'],
+                    options['scenario'] or benchmark.SCENARIOS,
+                )
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        self.stdout.write(benchmark.results_table(results, baseline))
+        if options['output']:
+            benchmark.save_report({
+                'revision': git_revision(),
+                'created': timezone.now().isoformat(),
+                'preset': options['preset'],
+                'seed': options['seed'],
+                'images': options['images'],
+                'requests': options['requests'],
+                'dataset': {model._meta.label: count
+                            for model, count in counts.items()},
+                'results': results,
+            }, options['output'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Замеры записаны в {options["output"]}'
+            ))
@@ -0,0 +1,47 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from posts.media import collect_media, collect_orphans
+
+
+class Command(BaseCommand):
+    help = ('Удаляет картинки постов, на которые больше никто '
+            'не ссылается, вместе с их миниатюрами; с --orphans ещё '
+            'и файлы и записи миниатюр, о которых не знает ни один пост.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=float, default=24,
+            help='Сколько часов файл должен пролежать без ссылок: '
+                 'ту же картинку могут как раз загружать снова.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько файлов или записей проверять за один проход.',
+        )
+        parser.add_argument(
+            '--orphans', action='store_true',
+            help='Обойти каталоги медиа и хранилище sorl целиком: '
+                 'медленно, но находит то, что счётчики ссылок упустили.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать файлы, ничего не удаляя.',
+        )
+
+    def handle(self, *args, **options):
+        min_age = timedelta(hours=options['min_age'])
+        verb = 'Можно удалить' if options['dry_run'] else 'Удалено'
+        removed = collect_media(min_age, options['batch_size'],
+                                options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(f'{verb} файлов: {removed}'))
+        if not options['orphans']:
+            return
+        orphans = collect_orphans(min_age, options['batch_size'],
+                                  options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} сирот: картинки {orphans["images"]}, '
+            f'записи миниатюр {orphans["sources"]}, '
+            f'файлы миниатюр {orphans["thumbnails"]}'
+        ))
@@ -0,0 +1,69 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.export import (EXPORTS, FORMATS, export_stamp, export_table,
+                          format_watermark, parse_watermark)
+
+
+class Command(BaseCommand):
+    help = ('Выгружает посты, комментарии и подписки в NDJSON, CSV '
+            'или столбцовый формат потоком, без загрузки таблиц в память.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'tables', nargs='*',
+            help=f'Что выгружать из {", ".join(EXPORTS)}, по умолчанию всё.',
+        )
+        parser.add_argument(
+            '--output-dir', default='.',
+            help='Куда писать файлы; в их именах время выгрузки, '
+                 'так что выгрузки копятся в одном каталоге.',
+        )
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--gzip', action='store_true',
+                            help='Сжимать файлы gzip.')
+        parser.add_argument(
+            '--chunk-size', type=int, default=2000,
+            help='Сколько строк читать из базы за раз.',
+        )
+        parser.add_argument(
+            '--watermark-file',
+            help='JSON с водяными знаками прошлой выгрузки: выгружаются '
+                 'только более новые строки, а знаки обновляются.',
+        )
+
+    def read_watermarks(self, path):
+        if not path or not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as marks:
+                return json.load(marks)
+        except ValueError as error:
+            raise CommandError(f'Не читается {path}: {error}')
+
+    def handle(self, *args, **options):
+        unknown = set(options['tables']) - set(EXPORTS)
+        if unknown:
+            raise CommandError(f'Неизвестные таблицы: {", ".join(unknown)}')
+        path = options['watermark_file']
+        watermarks = self.read_watermarks(path)
+        os.makedirs(options['output_dir'], exist_ok=True)
+        stamp = export_stamp()
+        for name in options['tables'] or EXPORTS:
+            model, field_name, _ = EXPORTS[name]
+            since = parse_watermark(model, field_name, watermarks.get(name))
+            output, count, watermark = export_table(
+                name, options['output_dir'], options['format'],
+                options['gzip'], since, options['chunk_size'], stamp,
+            )
+            if path and watermark is not None:
+                watermarks[name] = format_watermark(watermark)
+                with open(path, 'w') as marks:
+                    json.dump(watermarks, marks, indent=2)
+            if output is None:
+                self.stdout.write(f'{name}: новых строк нет')
+            else:
+                self.stdout.write(f'{name}: {count} строк -> {output}')
+        self.stdout.write(self.style.SUCCESS('Выгрузка готова'))
@@ -0,0 +1,56 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.dataset import PRESETS, DatasetGenerator
+
+COUNTS = ('users', 'groups', 'posts', 'comments', 'follows')
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками для нагрузочных тестов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--preset', choices=PRESETS, default='small',
+                            help='Размер набора данных.')
+        for name in COUNTS:
+            parser.add_argument(
+                f'--{name}', type=int,
+                help=f'Сколько создать ({name}) вместо числа из набора.',
+            )
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора: с тем же зерном данные те же.',
+        )
+        parser.add_argument(
+            '--images', type=float, default=0.0,
+            help='Доля постов с картинкой, от 0 до 1.',
+        )
+
+    def progress(self, model, count, seconds):
+        self.stdout.write(f'{model._meta.label}: {count} строк, '
+                          f'{count / max(seconds, 1e-6):.0f} строк/с')
+
+    def handle(self, *args, **options):
+        counts = dict(PRESETS[options['preset']])
+        for name in COUNTS:
+            if options[name] is not None:
+                if options[name] < 0:
+                    raise CommandError(f'--{name} не может быть меньше 0')
+                counts[name] = options[name]
+        if counts['users'] < 1:
+            raise CommandError('--users должно быть больше 0: '
+                               'постам и подпискам нужны авторы')
+        if not 0 <= options['images'] <= 1:
+            raise CommandError('--images должно быть от 0 до 1')
+        start = time.perf_counter()
+        generator = DatasetGenerator(
+            options['seed'], options['images'],
+            progress=self.progress if options['verbosity'] else None,
+        )
+        created = generator.generate(**counts)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано строк: {sum(created.values())} за '
+            f'{time.perf_counter() - start:.1f} с'
+        ))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счётчики постов, комментариев и подписок с данными '
+            'и исправляет расхождения пачками.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк сверять за один проход.',
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать расхождения, ничего не меняя.',
+        )
+
+    def handle(self, *args, **options):
+        repaired = reconcile_counters(options['batch_size'],
+                                      options['dry_run'])
+        verb = 'Найдено расхождений' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb}: группы {repaired["groups"]}, '
+            f'посты {repaired["posts"]}, '
+            f'пользователи {repaired["users"]}'
+        ))
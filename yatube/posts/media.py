@@ -0,0 +1,220 @@
+import os
+import time
+from itertools import islice
+from types import SimpleNamespace
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .models import MediaFile, Post
+
+
+def image_name(post):
+    """Имя картинки поста или None, если поле не загружено."""
+    if 'image' not in post.__dict__:
+        return None
+    value = post.__dict__['image']
+    return getattr(value, 'name', value) or ''
+
+
+def retain_file(name):
+    """Добавляет ссылку на файл картинки."""
+    if not name:
+        return
+    retained = MediaFile.objects.filter(name=name)
+    if retained.update(refs=F('refs') + 1, released=None):
+        return
+    try:
+        with transaction.atomic():
+            MediaFile.objects.create(name=name, refs=1)
+    except IntegrityError:
+        retained.update(refs=F('refs') + 1, released=None)
+
+
+def hold_file(name):
+    """Отодвигает удаление файла без ссылок, который загрузили снова:
+    отсчёт min_age для сборщика начинается заново.
+    """
+    MediaFile.objects.filter(name=name, refs=0).update(
+        released=timezone.now()
+    )
+
+
+def release_file(name):
+    """Убирает ссылку на файл; последняя отметит, с какого момента
+    файл никому не нужен.
+    """
+    if not name:
+        return
+    MediaFile.objects.filter(name=name).update(
+        refs=Greatest(F('refs') - 1, Value(0)),
+        released=Case(
+            When(refs__lte=1, then=Value(timezone.now())),
+            default=F('released'),
+            output_field=models.DateTimeField(),
+        ),
+    )
+
+
+def collect_media(min_age, batch_size=1000, dry_run=False):
+    """Удаляет файлы, на которые никто не ссылается дольше `min_age`,
+    вместе с их миниатюрами. Возвращает число удалённых файлов.
+    """
+    storage = Post._meta.get_field('image').storage
+    candidates = MediaFile.objects.filter(
+        refs=0, released__lt=timezone.now() - min_age
+    ).order_by('pk')
+    removed = 0
+    last_pk = 0
+    while True:
+        batch = list(candidates.filter(pk__gt=last_pk).values_list(
+            'pk', 'name'
+        )[:batch_size])
+        if not batch:
+            return removed
+        last_pk = batch[-1][0]
+        for pk, name in batch:
+            if not dry_run:
+                # Строка и файл удаляются в одной транзакции: загрузка
+                # той же картинки ждёт её и после проверяет файл.
+                with transaction.atomic():
+                    # Пока шла пачка, на файл могли сослаться снова.
+                    if not candidates.filter(pk=pk).delete()[0]:
+                        continue
+                    default.kvstore.delete(ImageFile(name, storage))
+                    storage.delete(name)
+            removed += 1
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def walk_files(storage, directory):
+    """Пути и время изменения файлов в каталоге хранилища.
+
+    Каталоги читаются через os.scandir по одному, поэтому список
+    всех файлов целиком в памяти не собирается.
+    """
+    directories = [storage.path(directory)]
+    while directories:
+        try:
+            entries = os.scandir(directories.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, storage.location)
+                    yield name.replace(os.sep, '/'), entry.stat().st_mtime
+
+
+def _referenced(names):
+    return set(Post.objects.filter(image__in=names).values_list(
+        'image', flat=True
+    ))
+
+
+def _old_files(files, min_age):
+    cutoff = time.time() - min_age.total_seconds()
+    return [name for name, mtime in files if mtime < cutoff]
+
+
+def _source_age_ok(image, cutoff):
+    """Файл картинки старше `cutoff` или его уже нет."""
+    try:
+        return image.storage.get_modified_time(image.name) < cutoff
+    except OSError:
+        return True
+
+
+def _orphaned_sources(min_age, batch_size):
+    """Пачки записей хранилища sorl о картинках старше `min_age`,
+    на которые не ссылается ни один пост.
+    """
+    cutoff = timezone.now() - min_age
+    rows = KVStoreModel.objects.filter(
+        key__startswith=add_prefix('', 'image')
+    ).order_by('key')
+    last_key = ''
+    while True:
+        batch = list(rows.filter(key__gt=last_key).values_list(
+            'key', 'value'
+        )[:batch_size])
+        if not batch:
+            return
+        last_key = batch[-1][0]
+        sources = {}
+        for key, value in batch:
+            image = deserialize_image_file(value)
+            if not image.name.startswith(sorl_settings.THUMBNAIL_PREFIX):
+                sources[image.name] = (del_prefix(key), image)
+        referenced = _referenced(list(sources))
+        orphans = [
+            key for name, (key, image) in sources.items()
+            if name not in referenced and _source_age_ok(image, cutoff)
+        ]
+        if orphans:
+            yield orphans
+
+
+def collect_orphans(min_age, batch_size=1000, dry_run=False):
+    """Удаляет картинки, на которые не ссылается ни один пост,
+    и миниатюры без записи в хранилище sorl.
+
+    Каталоги медиа и хранилище sorl читаются пачками по `batch_size`,
+    так что память не растёт с числом файлов. Файлы моложе `min_age`
+    и записи sorl о таких картинках не трогаются: пост с ними может
+    быть ещё не сохранён. Возвращает
+    число найденных записей и файлов каждого вида.
+    """
+    removed = {'sources': 0, 'images': 0, 'thumbnails': 0}
+    for keys in _orphaned_sources(min_age, batch_size):
+        if not dry_run:
+            for key in keys:
+                # Удаление по одному ключу: записи миниатюр и их файлы
+                # уходят вместе с записью картинки.
+                default.kvstore.delete(SimpleNamespace(key=key))
+        removed['sources'] += len(keys)
+
+    field = Post._meta.get_field('image')
+    storage = field.storage
+    for files in _chunks(walk_files(storage, field.upload_to), batch_size):
+        names = _old_files(files, min_age)
+        orphans = set(names) - _referenced(names)
+        if not dry_run:
+            for name in orphans:
+                storage.delete(name)
+            MediaFile.objects.filter(name__in=orphans).delete()
+        removed['images'] += len(orphans)
+
+    storage = default.storage
+    for files in _chunks(
+        walk_files(storage, sorl_settings.THUMBNAIL_PREFIX), batch_size
+    ):
+        keys = {
+            add_prefix(ImageFile(name, storage).key): name
+            for name in _old_files(files, min_age)
+        }
+        known = set(KVStoreModel.objects.filter(
+            key__in=list(keys)
+        ).values_list('key', flat=True))
+        orphans = [name for key, name in keys.items() if key not in known]
+        if not dry_run:
+            for name in orphans:
+                storage.delete(name)
+        removed['thumbnails'] += len(orphans)
+    return removed
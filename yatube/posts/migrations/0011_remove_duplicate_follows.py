@@ -0,0 +1,33 @@
+from django.db import migrations
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    duplicates = Follow.objects.values('user_id', 'author_id').annotate(
+        first=Min('pk'), total=Count('pk'),
+    ).filter(total__gt=1).order_by()
+    for row in duplicates.iterator():
+        Follow.objects.filter(
+            user_id=row['user_id'], author_id=row['author_id'],
+        ).exclude(pk=row['first']).delete()
+        extra = row['total'] - 1
+        UserStats.objects.filter(user_id=row['user_id']).update(
+            following_count=F('following_count') - extra
+        )
+        UserStats.objects.filter(user_id=row['author_id']).update(
+            followers_count=F('followers_count') - extra
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_follows,
+                             migrations.RunPython.noop),
+    ]
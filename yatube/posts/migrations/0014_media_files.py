@@ -0,0 +1,53 @@
+# Generated by Django 2.2.28 on 2026-10-18 04:51
+
+import core.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_refs(apps, schema_editor):
+    MediaFile = apps.get_model('posts', 'MediaFile')
+    Post = apps.get_model('posts', 'Post')
+    MediaFile.objects.bulk_create(
+        [
+            MediaFile(name=name, refs=total)
+            for name, total in Post.objects.exclude(image='').order_by(
+            ).values('image').annotate(total=Count('pk')).values_list(
+                'image', 'total'
+            ).iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_fts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Путь')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Число ссылок')),
+                ('released', models.DateTimeField(blank=True, null=True, verbose_name='Без ссылок с')),
+            ],
+        ),
+        # Хранилище не меняет схему, а пересоздание таблицы в SQLite
+        # потеряло бы триггеры полнотекстового индекса.
+        migrations.SeparateDatabaseAndState(state_operations=[
+            migrations.AlterField(
+                model_name='post',
+                name='image',
+                field=models.ImageField(blank=True, storage=core.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+            ),
+        ]),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(fields=['released'], name='mediafile_released_idx'),
+        ),
+        migrations.RunPython(count_refs, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,93 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+FTS_TABLE = 'posts_post_fts'
+WORD_RE = re.compile(r'\w+')
+
+
+def fts_available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Запрос FTS5 из пользовательской строки.
+
+    Операторы и кавычки FTS5 отбрасываются, каждое слово ищется
+    как префикс, все слова должны встретиться в посте.
+    """
+    return ' '.join(f'"{word}"*' for word in WORD_RE.findall(query))
+
+
+class SearchResults:
+    """Посты, найденные в FTS5, в порядке bm25.
+
+    Поддерживает count() и срезы, поэтому отдаётся паджинатору как
+    обычная выборка: каждая страница — один запрос к индексу
+    с LIMIT/OFFSET и один запрос за самими постами.
+    """
+
+    def __init__(self, query):
+        self.match = match_expression(query)
+
+    def _execute(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def count(self):
+        if not self.match:
+            return 0
+        return self._execute(
+            f'SELECT COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+            [self.match],
+        )[0][0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        if not self.match:
+            return []
+        start = key.start or 0
+        limit = -1 if key.stop is None else max(key.stop - start, 0)
+        ids = [pk for pk, in self._execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}), rowid DESC LIMIT %s OFFSET %s',
+            [self.match, limit, start],
+        )]
+        posts = Post.objects.for_cards().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def search_posts(query):
+    """Посты по поисковому запросу, самые подходящие первыми."""
+    if fts_available():
+        return SearchResults(query)
+    posts = Post.objects.for_cards()
+    for word in WORD_RE.findall(query):
+        posts = posts.filter(text__icontains=word)
+    return posts
+
+
+def filter_matching(queryset, query):
+    """Оставляет в выборке постов только найденные в индексе."""
+    return queryset.filter(pk__in=RawSQL(
+        f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s',
+        [match_expression(query)],
+    ))
+
+
+def rebuild_search_index():
+    """Заново строит индекс по текущим постам."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+        )
+        cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
@@ -0,0 +1,179 @@
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from core.pagecache import bump_page_version
+from core.storage import content_reused
+from core.utils import count_cache_key
+from .cards import bump_card_version
+from .counters import shift_group_posts, shift_post_comments, shift_user_stats
+from .media import hold_file, image_name, release_file, retain_file
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .timeline import (author_unfollowed, backfill_timeline, fan_out_post,
+                       prune_timeline)
+
+
+def shift_count(key, delta):
+    """Сдвигает закэшированный счётчик; промах пересчитается сам."""
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def shift_post_counts(author_id, group_id, delta):
+    shift_count(count_cache_key('posts'), delta)
+    shift_count(count_cache_key('author', author_id), delta)
+    if group_id is not None:
+        shift_count(count_cache_key('group', group_id), delta)
+    cache.delete_many([
+        count_cache_key('follow', user_id)
+        for user_id in Follow.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True)
+    ])
+
+
+def bump_profile_pages(user_id):
+    username = User.objects.filter(
+        pk=user_id
+    ).values_list('username', flat=True).first()
+    if username is not None:
+        bump_page_version('profile', username)
+
+
+def bump_post_pages(author_id, group_ids):
+    """Сбрасывает кэш лент, где виден пост автора из этих групп."""
+    bump_page_version('index')
+    bump_profile_pages(author_id)
+    for slug in Group.objects.filter(
+        pk__in=set(group_ids) - {None}
+    ).values_list('slug', flat=True):
+        bump_page_version('group', slug)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    # Счётчики нового пользователя нулевые; потом их сдвигает
+    # shift_user_stats, который строк не создаёт.
+    if created and not raw:
+        UserStats.objects.get_or_create(user_id=instance.pk)
+
+
+@receiver(post_init, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    instance._initial_group_id = instance.group_id
+    instance._initial_image = image_name(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        shift_post_counts(instance.author_id, instance.group_id, 1)
+        shift_user_stats(instance.author_id, posts_count=1)
+        shift_group_posts(instance.group_id, 1)
+        fan_out_post(instance)
+    elif instance._initial_group_id != instance.group_id:
+        for group_id, delta in ((instance._initial_group_id, -1),
+                                (instance.group_id, 1)):
+            if group_id is not None:
+                shift_count(count_cache_key('group', group_id), delta)
+            shift_group_posts(group_id, delta)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    shift_post_counts(instance.author_id, instance.group_id, -1)
+    shift_user_stats(instance.author_id, posts_count=-1)
+    shift_group_posts(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def count_saved_image(sender, instance, created, **kwargs):
+    name = instance.image.name
+    if created:
+        retain_file(name)
+    elif instance._initial_image not in (None, name):
+        retain_file(name)
+        release_file(instance._initial_image)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_image(sender, instance, **kwargs):
+    release_file(image_name(instance))
+
+
+@receiver(content_reused)
+def hold_reused_file(sender, name, **kwargs):
+    hold_file(name)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def expire_post_card(sender, instance, **kwargs):
+    bump_card_version('post', instance.pk)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def expire_post_pages(sender, instance, **kwargs):
+    bump_post_pages(instance.author_id,
+                    [instance.group_id, instance._initial_group_id])
+
+
+@receiver(post_save, sender=User)
+def expire_author_cards(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and set(update_fields) == {'last_login'}:
+        return
+    bump_card_version('user', instance.pk)
+    bump_page_version()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def expire_group_cards(sender, instance, **kwargs):
+    bump_card_version('group', instance.pk)
+    bump_page_version()
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def reset_follow_count(sender, instance, **kwargs):
+    cache.delete(count_cache_key('follow', instance.user_id))
+    bump_profile_pages(instance.author_id)
+    bump_profile_pages(instance.user_id)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_followed_posts(sender, instance, created, **kwargs):
+    if created:
+        shift_user_stats(instance.author_id, followers_count=1)
+        shift_user_stats(instance.user_id, following_count=1)
+        backfill_timeline(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_unfollowed_posts(sender, instance, **kwargs):
+    shift_user_stats(instance.author_id, followers_count=-1)
+    shift_user_stats(instance.user_id, following_count=-1)
+    prune_timeline(instance.user_id, instance.author_id)
+    author_unfollowed(instance.author_id)
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        shift_post_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    shift_post_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def forget_post_group(sender, instance, **kwargs):
+    # Подключён последним: остальным обработчикам нужны старые группа
+    # и картинка.
+    instance._initial_group_id = instance.group_id
+    instance._initial_image = instance.image.name
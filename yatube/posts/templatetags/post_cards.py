@@ -0,0 +1,10 @@
+from django import template
+
+from posts.cards import render_cards
+
+register = template.Library()
+
+
+@register.filter
+def post_cards(posts):
+    return render_cards(posts)
@@ -0,0 +1,15 @@
+from django import template
+
+from posts.thumbnails import post_picture, ready_thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture_for(post):
+    """Контекст <picture> для картинки поста или None.
+
+    Пока миниатюр нет, их построение ставится в очередь,
+    а шаблон показывает заглушку.
+    """
+    return post_picture(post, ready_thumbnails([post]).get(post.pk, {}))
@@ -0,0 +1,541 @@
+import csv
+import glob
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count, F
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.images import ImageFile
+
+from .. import benchmark
+from ..dataset import PRESETS, DatasetGenerator
+from ..models import (Comment, Follow, Group, MediaFile, Post,
+                      TimelineEntry, UserStats)
+from ..search import search_posts
+from ..thumbnails import (THUMBNAIL_SIZES, ready_thumbnail,
+                          render_thumbnails)
+from .test_views import SMALL_GIF
+
+User = get_user_model()
+
+
+class RebuildTimelinesCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        for number in range(3):
+            Post.objects.create(text=f'пост {number}', author=cls.author)
+
+    def test_posts_fanned_out_to_followers(self):
+        """Новые посты автора попадают в ленту подписчика."""
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.reader).count(), 3
+        )
+
+    def test_rebuild_repairs_timeline(self):
+        """Команда восстанавливает испорченную ленту."""
+        TimelineEntry.objects.filter(user=self.reader).first().delete()
+        TimelineEntry.objects.create(
+            user=self.reader, author=self.reader,
+            post=Post.objects.create(text='чужой', author=self.reader),
+            pub_date=Post.objects.latest('pub_date').pub_date,
+        )
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertQuerysetEqual(
+            TimelineEntry.objects.filter(user=self.reader),
+            Post.objects.filter(author=self.author).values_list(
+                'pk', flat=True
+            ),
+            transform=lambda entry: entry.post_id,
+        )
+
+
+class ReconcileCountersCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(title='группа', slug='group',
+                                         description='описание')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(text='пост', author=cls.author,
+                                       group=cls.group)
+        Post.objects.create(text='второй', author=cls.author)
+        Comment.objects.create(text='коммент', author=cls.reader,
+                               post=cls.post)
+
+    def assert_counters(self):
+        self.group.refresh_from_db()
+        self.post.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(
+            (self.author.stats.posts_count, self.author.stats.followers_count,
+             self.reader.stats.following_count),
+            (2, 1, 1),
+        )
+
+    def test_counters_follow_writes(self):
+        """Счётчики обновляются при создании записей."""
+        self.assert_counters()
+
+    def test_reconcile_repairs_drift(self):
+        """Команда чинит разошедшиеся счётчики."""
+        Group.objects.update(posts_count=7)
+        Post.objects.update(comments_count=0)
+        UserStats.objects.update(posts_count=0, followers_count=5)
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.author.refresh_from_db()
+        self.reader.refresh_from_db()
+        self.assert_counters()
+
+
+class RebuildSearchIndexCommandTest(TestCase):
+    def test_rebuild_restores_index(self):
+        """Команда возвращает в индекс посты, которых в нём нет."""
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(text='редкое слово', author=author)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO posts_post_fts(posts_post_fts) "
+                "VALUES ('delete-all')"
+            )
+        self.assertEqual(list(search_posts('редкое')[:10]), [])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(list(search_posts('редкое')[:10]), [post])
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CollectMediaCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def create_post(self, content=SMALL_GIF, name='small.gif'):
+        return Post.objects.create(
+            text='пост', author=self.author,
+            image=SimpleUploadedFile(name, content, 'image/gif'),
+        )
+
+    def collect(self, *args):
+        call_command('collect_media', '--min-age=0', *args,
+                     stdout=StringIO())
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые картинки лежат в одном файле с общим счётчиком."""
+        first = self.create_post(name='first.gif')
+        second = self.create_post(name='second.GIF')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertTrue(first.image.name.endswith('.gif'))
+        self.assertEqual(
+            MediaFile.objects.get(name=first.image.name).refs, 2
+        )
+
+    def test_replaced_image_released(self):
+        """Заменённая картинка теряет ссылку, новая её получает."""
+        post = self.create_post()
+        old_name = post.image.name
+        post.image = SimpleUploadedFile('new.gif', SMALL_GIF + b'\0',
+                                        'image/gif')
+        post.save()
+        old = MediaFile.objects.get(name=old_name)
+        self.assertEqual(old.refs, 0)
+        self.assertIsNotNone(old.released)
+        self.assertEqual(
+            MediaFile.objects.get(name=post.image.name).refs, 1
+        )
+
+    def test_collect_removes_unreferenced_files(self):
+        """Команда удаляет файлы без ссылок вместе с миниатюрами
+        и не трогает те, на которые ещё ссылаются.
+        """
+        kept = self.create_post(content=SMALL_GIF + b'\0')
+        first = self.create_post()
+        second = self.create_post()
+        name = first.image.name
+        storage = first.image.storage
+        render_thumbnails(first.pk, name)
+        thumbnail = ready_thumbnail(first.image, 'card')
+        first.delete()
+        self.collect()
+        self.assertTrue(storage.exists(name))
+        second.delete()
+        self.collect('--dry-run')
+        self.assertTrue(storage.exists(name))
+        self.collect()
+        self.assertFalse(storage.exists(name))
+        self.assertFalse(thumbnail.exists())
+        self.assertIsNone(ready_thumbnail(first.image, 'card'))
+        self.assertFalse(MediaFile.objects.filter(name=name).exists())
+        self.assertTrue(storage.exists(kept.image.name))
+
+    def test_recently_released_files_kept(self):
+        """Файл, который только что остался без ссылок, не удаляется:
+        ту же картинку могут загружать снова.
+        """
+        post = self.create_post()
+        post.delete()
+        MediaFile.objects.update(released=timezone.now())
+        call_command('collect_media', stdout=StringIO())
+        self.assertTrue(post.image.storage.exists(post.image.name))
+        MediaFile.objects.update(
+            released=timezone.now() - timedelta(days=2)
+        )
+        call_command('collect_media', stdout=StringIO())
+        self.assertFalse(post.image.storage.exists(post.image.name))
+
+    def test_reupload_holds_released_file(self):
+        """Повторная загрузка файла без ссылок заново откладывает его
+        удаление, пока пост с ним ещё не сохранён.
+        """
+        post = self.create_post()
+        post.delete()
+        MediaFile.objects.update(
+            released=timezone.now() - timedelta(days=2)
+        )
+        storage = post.image.storage
+        name = storage.save('posts/again.gif',
+                            SimpleUploadedFile('again.gif', SMALL_GIF))
+        self.assertEqual(name, post.image.name)
+        call_command('collect_media', stdout=StringIO())
+        self.assertTrue(storage.exists(name))
+        self.assertTrue(MediaFile.objects.filter(name=name).exists())
+
+
+ORPHANS_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=ORPHANS_MEDIA_ROOT)
+class CollectOrphansCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(ORPHANS_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.kept = self.create_post(SMALL_GIF)
+        self.deleted = self.create_post(SMALL_GIF + b'\0')
+        self.storage = self.kept.image.storage
+        self.stray_image = self.storage.save(
+            'posts/stray.gif', SimpleUploadedFile('stray.gif', SMALL_GIF[:-1])
+        )
+        self.stray_thumbnail = default.storage.save(
+            'cache/00/00/stray.gif', SimpleUploadedFile('stray.gif', SMALL_GIF)
+        )
+        self.deleted_thumbnail = ready_thumbnail(self.deleted.image, 'card')
+        Post.objects.filter(pk=self.deleted.pk).delete()
+        past = time.time() - 2 * 24 * 3600
+        for directory, _, files in os.walk(settings.MEDIA_ROOT):
+            for name in files:
+                os.utime(os.path.join(directory, name), (past, past))
+
+    def create_post(self, content):
+        post = Post.objects.create(
+            text='пост', author=self.author,
+            image=SimpleUploadedFile('small.gif', content, 'image/gif'),
+        )
+        render_thumbnails(post.pk, post.image.name)
+        return post
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command('collect_media', '--orphans', '--batch-size=2', *args,
+                     stdout=out)
+        return out.getvalue()
+
+    def test_dry_run_only_counts(self):
+        """С --dry-run команда считает лишнее и ничего не удаляет."""
+        self.assertIn('сирот: картинки 2, записи миниатюр 1, '
+                      'файлы миниатюр 1', self.collect('--dry-run'))
+        self.assertTrue(self.storage.exists(self.deleted.image.name))
+        self.assertTrue(default.storage.exists(self.stray_thumbnail))
+        self.assertTrue(self.deleted_thumbnail.exists())
+
+    def test_orphans_removed(self):
+        """Удаляются картинки без постов, их миниатюры и файлы
+        миниатюр без записи в хранилище sorl.
+        """
+        self.collect()
+        self.assertFalse(self.storage.exists(self.deleted.image.name))
+        self.assertFalse(self.storage.exists(self.stray_image))
+        self.assertFalse(default.storage.exists(self.stray_thumbnail))
+        self.assertFalse(self.deleted_thumbnail.exists())
+        self.assertIsNone(ready_thumbnail(self.deleted.image, 'card'))
+        self.assertFalse(
+            MediaFile.objects.filter(name=self.deleted.image.name).exists()
+        )
+
+    def test_referenced_and_fresh_files_kept(self):
+        """Картинки постов, их миниатюры и свежие файлы остаются."""
+        fresh = self.storage.save(
+            'posts/fresh.gif', SimpleUploadedFile('fresh.gif',
+                                                  SMALL_GIF + b'\0\0')
+        )
+        # Миниатюры уже построены, а пост с картинкой ещё не сохранён.
+        render_thumbnails(0, fresh)
+        self.collect()
+        self.assertTrue(self.storage.exists(self.kept.image.name))
+        self.assertTrue(self.storage.exists(fresh))
+        self.assertIsNotNone(
+            ready_thumbnail(ImageFile(fresh, self.storage), 'card')
+        )
+        for size in THUMBNAIL_SIZES:
+            self.assertTrue(ready_thumbnail(self.kept.image, size).exists())
+
+
+class ExportDataCommandTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.posts = [
+            Post.objects.create(text=f'пост {number}', author=cls.author)
+            for number in range(3)
+        ]
+        Comment.objects.create(post=cls.posts[0], author=cls.reader,
+                               text='комментарий')
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def export(self, *args):
+        call_command('export_data', f'--output-dir={self.directory}',
+                     '--chunk-size=2', *args, stdout=StringIO())
+
+    def paths(self, table, extension):
+        """Файлы выгрузок таблицы от старых к новым."""
+        return sorted(glob.glob(
+            os.path.join(self.directory, f'{table}.*.{extension}')
+        ))
+
+    def test_ndjson_gzip(self):
+        """Каждая таблица выгружается в свой сжатый NDJSON."""
+        self.export('--gzip')
+        [path] = self.paths('posts', 'ndjson.gz')
+        with gzip.open(path, 'rt') as export:
+            rows = [json.loads(line) for line in export]
+        self.assertEqual([row['text'] for row in rows],
+                         ['пост 0', 'пост 1', 'пост 2'])
+        self.assertEqual(rows[0]['author_id'], self.author.pk)
+        self.assertEqual(rows[0]['pub_date'],
+                         self.posts[0].pub_date.isoformat())
+        [path] = self.paths('follows', 'ndjson.gz')
+        with gzip.open(path, 'rt') as export:
+            self.assertEqual(json.loads(export.readline())['user_id'],
+                             self.reader.pk)
+
+    def test_csv(self):
+        """CSV начинается с заголовка."""
+        self.export('comments', '--format=csv')
+        [path] = self.paths('comments', 'csv')
+        with open(path, newline='') as export:
+            rows = list(csv.DictReader(export))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['post_id'], str(self.posts[0].pk))
+        self.assertEqual(self.paths('posts', 'csv'), [])
+
+    def test_columnar(self):
+        """Столбцовый формат пишет строки группами по chunk-size."""
+        self.export('posts', '--format=columnar')
+        [path] = self.paths('posts', 'columnar.ndjson')
+        with open(path) as export:
+            header, *groups = [json.loads(line) for line in export]
+        self.assertIn('pub_date', header['columns'])
+        self.assertEqual([group['rows'] for group in groups], [2, 1])
+        self.assertEqual(groups[1]['data']['text'], ['пост 2'])
+        self.assertEqual(groups[0]['data']['pub_date'][0],
+                         self.posts[0].pub_date.isoformat())
+
+    def test_incremental_export(self):
+        """С файлом водяных знаков повторная выгрузка берёт только
+        новые строки в новый файл, а без новых строк файла не пишет.
+        """
+        marks = os.path.join(self.directory, 'marks.json')
+        self.export('posts', f'--watermark-file={marks}')
+        Post.objects.create(text='новый пост', author=self.author)
+        self.export('posts', f'--watermark-file={marks}')
+        self.export('posts', f'--watermark-file={marks}')
+        first, second = self.paths('posts', 'ndjson')
+        with open(first) as export:
+            self.assertEqual(len(export.readlines()), 3)
+        with open(second) as export:
+            rows = [json.loads(line) for line in export]
+        self.assertEqual([row['text'] for row in rows], ['новый пост'])
+
+
+DATASET_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=DATASET_MEDIA_ROOT)
+class GenerateDatasetCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(DATASET_MEDIA_ROOT, ignore_errors=True)
+
+    def generate(self, *args):
+        call_command('generate_dataset', '--users=30', '--groups=3',
+                     '--posts=200', '--comments=300', '--follows=150',
+                     *args, stdout=StringIO())
+
+    def test_counts(self):
+        """Создаётся столько строк, сколько задано, и счётчики с лентами
+        пересчитаны.
+        """
+        self.generate('--images=0.5')
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 300)
+        self.assertEqual(Follow.objects.count(), 150)
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+        author = Post.objects.values('author').annotate(
+            total=Count('pk')
+        ).order_by('-total').first()
+        self.assertEqual(
+            UserStats.objects.get(user_id=author['author']).posts_count,
+            author['total'],
+        )
+        self.assertTrue(TimelineEntry.objects.exists())
+        with_image = Post.objects.exclude(image='')
+        self.assertTrue(0 < with_image.count() < 200)
+        self.assertEqual(sum(MediaFile.objects.values_list('refs', flat=True)),
+                         with_image.count())
+        self.assertTrue(with_image.first().image.storage.exists(
+            with_image.first().image.name
+        ))
+
+    def test_zipf_followers(self):
+        """У самого популярного автора намного больше подписчиков,
+        чем в среднем.
+        """
+        self.generate()
+        followers = list(UserStats.objects.values_list('followers_count',
+                                                       flat=True))
+        self.assertGreater(max(followers), 3 * sum(followers) / len(followers))
+
+    def test_seed_is_deterministic(self):
+        """С тем же зерном данные повторяются, с другим — нет."""
+        def texts():
+            return list(Post.objects.order_by('pk').values_list(
+                'text', 'author__username', 'pub_date'
+            ))
+
+        self.generate('--seed=7')
+        first = texts()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.generate('--seed=7')
+        self.assertEqual([row[0] for row in texts()],
+                         [row[0] for row in first])
+        User.objects.all().delete()
+        self.generate('--seed=8')
+        self.assertNotEqual([row[0] for row in texts()],
+                            [row[0] for row in first])
+
+    def test_preset(self):
+        """Числа из набора можно переопределить."""
+        call_command('generate_dataset', '--preset=small', '--posts=0',
+                     '--comments=5', '--users=4', '--follows=100',
+                     stdout=StringIO())
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(Group.objects.count(), PRESETS['small']['groups'])
+        self.assertFalse(Post.objects.exists())
+        self.assertFalse(Comment.objects.exists())
+        self.assertLessEqual(Follow.objects.count(), 12)
+
+    def test_cached_pages_expired(self):
+        """Главная, закэшированная до генерации, показывает новые посты
+        и их число.
+        """
+        cache.clear()
+        self.client.get(reverse('posts:index'))
+        self.generate()
+        response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.context['page_obj'].paginator.count, 200)
+
+    def test_sequences_reset(self):
+        """После вставки с заданными pk сдвигаются последовательности
+        всех заполненных таблиц.
+        """
+        with mock.patch.object(connection.ops, 'sequence_reset_sql',
+                               return_value=[]) as reset:
+            self.generate()
+        self.assertCountEqual(reset.call_args[0][1],
+                              [User, Group, Post, Comment, Follow])
+
+    def test_users_required(self):
+        """Без пользователей команда отказывается работать и ничего
+        не создаёт.
+        """
+        with self.assertRaises(CommandError):
+            self.generate('--users=0')
+        self.assertFalse(User.objects.exists())
+
+
+class BenchmarkViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        DatasetGenerator(seed=1).generate(users=20, groups=2, posts=60,
+                                          comments=40, follows=60)
+
+    def test_percentile(self):
+        samples = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(samples, 0.5), 50)
+        self.assertEqual(benchmark.percentile(samples, 0.99), 99)
+        self.assertEqual(benchmark.percentile([7], 0.95), 7)
+
+    def test_views_measured_warm_and_cold(self):
+        """Каждая страница замеряется в обоих сценариях, и на тёплом
+        кэше запросов к базе меньше.
+        """
+        results = benchmark.run_benchmark(requests=3)
+        self.assertEqual(set(results), set(benchmark.SCENARIOS))
+        for scenario in benchmark.SCENARIOS:
+            self.assertEqual(set(results[scenario]), set(benchmark.VIEWS))
+        cold, warm = results['cold'], results['warm']
+        for name in benchmark.VIEWS:
+            self.assertGreater(cold[name]['bytes'], 0)
+            self.assertLessEqual(cold[name]['p50_ms'],
+                                 cold[name]['p99_ms'])
+        self.assertLess(warm['posts:index']['queries'],
+                        cold['posts:index']['queries'])
+        table = benchmark.results_table(results, baseline=results)
+        self.assertIn('+0%', table)
@@ -6,8 +6,10 @@ from django.conf import settings
 from posts.forms import Post
 from posts.models import Post
 from django.test import Client, TestCase, override_settings
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from core.storage import content_name
 from ..models import Group, Post, Comment
 from http import HTTPStatus
 
@@ -41,6 +43,8 @@ class PostModelTest(TestCase):
                          b'\x02\x00\x01\x00\x00\x02\x02\x0C'
                          b'\x0A\x00\x3B'
                          )
+        cls.image_name = content_name('posts/small.gif',
+                                      ContentFile(cls.small_gif))
         cls.uploaded = SimpleUploadedFile(
             name='small.gif',
             content=cls.small_gif,
@@ -79,7 +83,7 @@ class PostModelTest(TestCase):
                              )
         self.assertTrue(Post.objects.filter(group=form_data['group'],
                                             text=form_data['text'],
-                                            image='posts/small.gif',
+                                            image=self.image_name,
                                             ).exists())
         self.assertEqual(HTTPStatus.OK, response.status_code)
 
@@ -194,17 +198,114 @@ class PostModelTest(TestCase):
                                                post=self.post,).exists())
 
     def test_cache_index(self):
-        """Проверка хранения и очищения кэша для index."""
+        """Index берётся из кэша и обновляется сразу после
+        изменения постов.
+        """
         response_one = self.authorized_client.get(reverse('posts:index'))
         posts = response_one.content
+        Post.objects.filter(pk=self.post.pk).update(text='мимо сигналов')
+        response_two = self.authorized_client.get(reverse('posts:index'))
+        old_posts = response_two.content
+        self.assertEqual(old_posts, posts)
         Post.objects.create(
             text='test_new_post',
             author=self.post.author,
         )
-        response_two = self.authorized_client.get(reverse('posts:index'))
-        old_posts = response_two.content
-        self.assertEqual(old_posts, posts)
-        cache.clear()
         response_three = self.authorized_client.get(reverse('posts:index'))
         new_posts = response_three.content
         self.assertNotEqual(old_posts, new_posts)
+        self.assertContains(response_three, 'test_new_post')
+
+    def test_cache_group_and_profile(self):
+        """Страницы группы и профиля обновляются сразу после
+        нового поста и подписки.
+        """
+        group_url = reverse('posts:group_list', kwargs={'slug': 'test-slug'})
+        profile_url = reverse('posts:profile', kwargs={'username': 'auth'})
+        self.authorized_client1.get(group_url)
+        self.authorized_client1.get(profile_url)
+        Post.objects.create(text='свежий пост', author=self.user,
+                            group=self.group)
+        self.assertContains(self.authorized_client1.get(group_url),
+                            'свежий пост')
+        self.authorized_client1.get(reverse('posts:profile_follow',
+                                            kwargs={'username': 'auth'}))
+        self.assertContains(self.authorized_client1.get(profile_url),
+                            'Отписаться')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageUploadLimitsTest(TestCase):
+    small_gif = (b'\x47\x49\x46\x38\x39\x61\x02\x00'
+                 b'\x01\x00\x80\x00\x00\x00\x00\x00'
+                 b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+                 b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+                 b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+                 b'\x0A\x00\x3B')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def upload(self, content, name='upload.gif'):
+        response = self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile(name, content, 'image/gif'),
+        })
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFalse(Post.objects.exists())
+        return response.context['form'].errors
+
+    def test_valid_image_accepted(self):
+        """Картинка в пределах лимитов проходит проверку."""
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile('upload.gif', self.small_gif),
+        })
+        self.assertTrue(Post.objects.exists())
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=20)
+    def test_file_over_byte_limit(self):
+        """Файл больше лимита отклоняется."""
+        self.assertIn('Файл больше', self.upload(self.small_gif)['image'][0])
+
+    @override_settings(IMAGE_UPLOAD_MAX_BYTES=20,
+                       DATA_UPLOAD_MAX_MEMORY_SIZE=200)
+    def test_request_over_limit_passes_csrf(self):
+        """Запрос больше лимитов проходит проверку CSRF: браузер видит
+        ошибку формы, а не страницу отказа CSRF.
+        """
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        client.get(reverse('posts:post_create'))
+        response = client.post(reverse('posts:post_create'), {
+            'csrfmiddlewaretoken': client.cookies['csrftoken'].value,
+            'text': 'Пост с картинкой',
+            'image': SimpleUploadedFile('upload.gif', self.small_gif * 10,
+                                        'image/gif'),
+        })
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('Файл больше',
+                      response.context['form'].errors['image'][0])
+        self.assertFalse(Post.objects.exists())
+
+    def test_not_an_image(self):
+        """Файл без заголовка картинки отклоняется."""
+        errors = self.upload(b'not an image' * 10, 'fake.gif')
+        self.assertIn('Загрузите правильное изображение.', errors['image'])
+
+    @override_settings(IMAGE_UPLOAD_FORMATS=('PNG',))
+    def test_format_not_allowed(self):
+        """Формат из заголовка сверяется со списком разрешённых."""
+        errors = self.upload(self.small_gif)
+        self.assertIn('Формат GIF не поддерживается.', errors['image'])
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=1)
+    def test_too_many_pixels(self):
+        """Размер в пикселях берётся из заголовка и ограничивается."""
+        errors = self.upload(self.small_gif)
+        self.assertIn('Слишком много пикселей в изображении.',
+                      errors['image'])
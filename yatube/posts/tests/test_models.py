@@ -1,7 +1,7 @@
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 
-from ..models import Group, Post
+from ..models import Follow, Group, Post, UserStats
 
 User = get_user_model()
 
@@ -32,3 +32,19 @@ class PostModelTest(TestCase):
         task = PostModelTest.post
         expected_object_name = task.text[:15]
         self.assertEqual(expected_object_name, 'Тестовый пост')
+
+
+class UserDeletionTest(TransactionTestCase):
+    def test_user_with_posts_and_follows_deleted(self):
+        """Удаление автора с постами и подписками не заводит заново
+        его счётчики, и внешние ключи в конце транзакции целы.
+        """
+        author = User.objects.create_user(username='author')
+        reader = User.objects.create_user(username='reader')
+        Post.objects.create(author=author, text='Пост')
+        Follow.objects.create(user=reader, author=author)
+        Follow.objects.create(user=author, author=reader)
+        author.delete()
+        self.assertFalse(User.objects.filter(username='author').exists())
+        self.assertFalse(UserStats.objects.filter(user_id=author.pk).exists())
+        self.assertEqual(Follow.objects.count(), 0)
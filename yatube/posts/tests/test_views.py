@@ -2,12 +2,19 @@ from django import forms
 from django.core.cache import cache
 from django.contrib.auth import get_user_model
 from django.urls import reverse
+from core.jobs import claim_jobs, run_job
+from core.storage import content_name
 import shutil
 import tempfile
 from django.conf import settings
-from django.test import TestCase, Client, override_settings
+from django.test import (TestCase, TransactionTestCase, Client,
+                         override_settings)
+from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
-from ..models import Group, Post, User, Follow
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ..models import Comment, Follow, Group, Post, User
+from ..thumbnails import ready_thumbnail, render_thumbnails
 from ..views import NUMBER_OF_POSTS
 
 
@@ -40,6 +47,8 @@ class PostModelTest(TestCase):
                          b'\x0A\x00\x3B'
                          )
 
+        cls.image_name = content_name('posts/small.gif',
+                                      ContentFile(cls.small_gif))
         cls.uploaded = SimpleUploadedFile(
             name='small.gif',
             content=cls.small_gif,
@@ -108,7 +117,7 @@ class PostModelTest(TestCase):
         self.assertEqual(post_text_0, 'Тестовый пост')
         self.assertEqual(post_author_0, 'auth')
         self.assertEqual(post_group_0, 'Тестовая группа')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertEqual(post_image_0, self.image_name)
 
     def test_group_list_page_show_correct_context(self):
         """Шаблон group_list сформирован с правильным контекстом."""
@@ -127,7 +136,7 @@ class PostModelTest(TestCase):
         self.assertEqual(post_group_0, 'Тестовая группа')
         self.assertEqual(post_group_slug_0, 'test-slug')
         self.assertEqual(post_group_description_0, 'Тестовое описание')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertEqual(post_image_0, self.image_name)
 
     def test_profile_page_show_correct_context(self):
         """Шаблон profile сформирован с правильным контекстом."""
@@ -146,7 +155,7 @@ class PostModelTest(TestCase):
         self.assertEqual(post_group_0, 'Тестовая группа')
         self.assertEqual(post_group_slug_0, 'test-slug')
         self.assertEqual(post_group_description_0, 'Тестовое описание')
-        self.assertEqual(post_image_0, 'posts/small.gif')
+        self.assertEqual(post_image_0, self.image_name)
 
     def test_post_detail_page_show_correct_context(self):
         """Шаблон post_detail сформирован с правильным контекстом."""
@@ -158,7 +167,7 @@ class PostModelTest(TestCase):
                          )
         self.assertEqual(response.context.get('post').text, 'Тестовый пост')
         self.assertEqual(response.context.get('post').image.name,
-                         'posts/small.gif'
+                         self.image_name
                          )
         self.assertEqual(response.context.get('post').group.title,
                          'Тестовая группа'
@@ -292,3 +301,439 @@ class PaginatorViewsTest(TestCase):
                 self.assertEqual(len(response.context['page_obj']),
                                  TEMP_NUMB_SECOND_PAGE
                                  )
+
+    def test_cursor_pages(self):
+        """Курсорная паджинация листает ленту вперёд и назад
+        без COUNT(*).
+        """
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        first_page = self.client.get(url).context['page_obj']
+        self.assertEqual(len(first_page), NUMBER_OF_POSTS)
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(first_page.has_next())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                url, {'after': first_page.paginator.next_cursor}
+            )
+        self.assertFalse(any('COUNT' in query['sql']
+                             for query in queries.captured_queries))
+        second_page = response.context['page_obj']
+        self.assertEqual(len(second_page), TEMP_NUMB_SECOND_PAGE)
+        self.assertFalse(second_page.has_next())
+        response = self.client.get(
+            url, {'before': second_page.paginator.previous_cursor}
+        )
+        self.assertEqual(list(response.context['page_obj']),
+                         list(first_page))
+
+    def test_cursor_garbage_token(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.client.get(reverse('posts:index'),
+                                   {'after': 'не-курсор'})
+        self.assertEqual(len(response.context['page_obj']), NUMBER_OF_POSTS)
+
+    def test_post_count_kept_in_cache(self):
+        """Число постов берётся из кэша и обновляется при создании
+        и удалении поста.
+        """
+        url = reverse('posts:profile', kwargs={'username': self.author})
+        response = self.client.get(url, {'page': 1})
+        self.assertEqual(response.context['page_obj'].paginator.count,
+                         TEMP_NUMB_FIRST_PAGE)
+        post = Post.objects.create(text='ещё', author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'page': 1})
+        self.assertFalse(any('COUNT' in query['sql']
+                             for query in queries.captured_queries))
+        self.assertEqual(response.context['posts_count'],
+                         TEMP_NUMB_FIRST_PAGE + 1)
+        post.delete()
+        response = self.client.get(url, {'page': 1})
+        self.assertEqual(response.context['page_obj'].paginator.count,
+                         TEMP_NUMB_FIRST_PAGE)
+
+    @override_settings(PAGINATOR_EXACT_COUNT_LIMIT=5)
+    def test_approximate_count_above_limit(self):
+        """Выше порога паджинатор не считает записи точно,
+        но листает страницы.
+        """
+        url = reverse('posts:index')
+        page = self.client.get(url, {'page': 1}).context['page_obj']
+        self.assertTrue(page.paginator.approximate)
+        self.assertTrue(page.has_next())
+        page = self.client.get(url, {'page': 2}).context['page_obj']
+        self.assertEqual(len(page), TEMP_NUMB_SECOND_PAGE)
+        self.assertFalse(page.has_next())
+
+    @override_settings(PAGINATOR_EXACT_COUNT_LIMIT=5)
+    def test_page_past_approximate_end(self):
+        """Номер за концом ленты выше порога открывает последнюю
+        страницу, а не ошибку.
+        """
+        response = self.client.get(reverse('posts:index'), {'page': 99999})
+        self.assertEqual(response.status_code, 200)
+        page = response.context['page_obj']
+        self.assertEqual(page.number, 2)
+        self.assertEqual(len(page), TEMP_NUMB_SECOND_PAGE)
+
+    @override_settings(PAGINATOR_EXACT_COUNT_LIMIT=5)
+    def test_approximate_count_cached(self):
+        """То, что записей больше порога, тоже берётся из кэша."""
+        url = reverse('posts:group_list', kwargs={'slug': self.group.slug})
+        self.client.get(url, {'page': 1})
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(url, {'page': 2}).context['page_obj']
+        self.assertTrue(page.paginator.approximate)
+        self.assertFalse(any('COUNT' in query['sql']
+                             for query in queries.captured_queries))
+
+
+class FollowFeedTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = User.objects.create_user(username='reader')
+        cls.star = User.objects.create_user(username='star')
+        cls.friend = User.objects.create_user(username='friend')
+        Follow.objects.create(user=cls.reader, author=cls.star)
+        Follow.objects.create(user=cls.reader, author=cls.friend)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.reader)
+
+    @override_settings(FEED_PUSH_FOLLOWER_LIMIT=0)
+    def test_popular_authors_pulled_and_merged(self):
+        """Посты популярных авторов читаются при показе ленты
+        и сливаются с остальными по дате.
+        """
+        Follow.objects.create(user=self.friend, author=self.star)
+        for number in range(NUMBER_OF_POSTS):
+            author = self.star if number % 2 else self.friend
+            Post.objects.create(text=f'пост {number}', author=author)
+        self.assertFalse(self.reader.timeline.exists())
+        page = self.client.get(
+            reverse('posts:follow_index')
+        ).context['page_obj']
+        self.assertEqual(list(page), list(Post.objects.all()))
+        self.assertEqual(page.paginator.stats, {'pulled': 2, 'pushed': 0})
+
+    @override_settings(FEED_PUSH_FOLLOWER_LIMIT=1)
+    def test_pushed_and_pulled_pages(self):
+        """Смешанная лента листается курсором без пропусков."""
+        Follow.objects.create(user=self.friend, author=self.star)
+        for number in range(NUMBER_OF_POSTS + 3):
+            author = self.star if number % 3 else self.friend
+            Post.objects.create(text=f'пост {number}', author=author)
+        url = reverse('posts:follow_index')
+        first = self.client.get(url).context['page_obj']
+        self.assertEqual(first.paginator.stats, {'pulled': 1, 'pushed': 1})
+        second = self.client.get(
+            url, {'after': first.paginator.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(list(first) + list(second),
+                         list(Post.objects.all()))
+
+    @override_settings(FEED_PUSH_FOLLOWER_LIMIT=1)
+    def test_author_pushed_again_after_unfollow(self):
+        """Посты, вышедшие, пока автор был популярным, попадают в ленты,
+        когда подписчиков снова не больше порога.
+        """
+        follow = Follow.objects.create(user=self.friend, author=self.star)
+        post = Post.objects.create(text='пока популярен', author=self.star)
+        self.assertFalse(self.reader.timeline.filter(post=post).exists())
+        follow.delete()
+        for pk in claim_jobs(10):
+            self.assertTrue(run_job(pk))
+        self.assertTrue(self.reader.timeline.filter(post=post).exists())
+        page = self.client.get(
+            reverse('posts:follow_index')
+        ).context['page_obj']
+        self.assertEqual(page.paginator.stats, {'pulled': 0, 'pushed': 2})
+        self.assertIn(post, list(page))
+
+    @override_settings(FEED_PUSH_FOLLOWER_LIMIT=1)
+    def test_pulled_authors_read_once_per_page(self):
+        """Листание назад без полной страницы читает популярных
+        авторов один раз.
+        """
+        Follow.objects.create(user=self.friend, author=self.star)
+        for number in range(NUMBER_OF_POSTS + 3):
+            author = self.star if number % 3 else self.friend
+            Post.objects.create(text=f'пост {number}', author=author)
+        url = reverse('posts:follow_index')
+        first = self.client.get(url).context['page_obj']
+        second = self.client.get(
+            url, {'after': first.paginator.next_cursor}
+        ).context['page_obj']
+        with self.assertLogs('posts.feed', 'INFO') as logs:
+            page = self.client.get(
+                url, {'before': second.paginator.previous_cursor}
+            ).context['page_obj']
+        self.assertEqual(list(page), list(first))
+        self.assertEqual(len(logs.output), 1)
+
+
+class QueryCountTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(title='группа', slug='group',
+                                         description='описание')
+        Follow.objects.create(user=cls.user, author=cls.user)
+        cls.post = Post.objects.create(text='пост', author=cls.user,
+                                       group=cls.group)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile', kwargs={'username': self.user}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}),
+        )
+
+    def count_queries(self):
+        counts = {}
+        for url in self.urls:
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            counts[url] = len(queries)
+        return counts
+
+    def test_query_count_does_not_grow_with_posts(self):
+        """Число запросов на страницу не зависит от числа постов
+        и комментариев.
+        """
+        expected = self.count_queries()
+        for number in range(NUMBER_OF_POSTS):
+            author = User.objects.create_user(username=f'author{number}')
+            Post.objects.create(text='пост', author=author, group=self.group)
+            Comment.objects.create(text='коммент', author=author,
+                                   post=self.post)
+        self.assertEqual(self.count_queries(), expected)
+
+
+class PostCardCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author',
+                                              first_name='Старое')
+        cls.group = Group.objects.create(title='группа', slug='group',
+                                         description='описание')
+
+    def setUp(self):
+        cache.clear()
+        self.post = Post.objects.create(text='Первая версия',
+                                        author=self.author, group=self.group)
+        self.url = reverse('posts:profile',
+                           kwargs={'username': self.author.username})
+
+    def test_card_served_from_cache(self):
+        """Неизменённая карточка не рендерится заново."""
+        self.client.get(self.url)
+        with self.assertTemplateNotUsed('posts/includes/post_list.html'):
+            self.client.get(self.url)
+
+    def test_card_expires_on_changes(self):
+        """Карточка обновляется при правке поста, автора и группы."""
+        self.client.get(self.url)
+        self.post.text = 'Вторая версия'
+        self.post.save()
+        self.assertContains(self.client.get(self.url), 'Вторая версия')
+        self.author.first_name = 'Новое'
+        self.author.save()
+        self.assertContains(self.client.get(self.url), 'Новое')
+        self.group.slug = 'renamed'
+        self.group.save()
+        self.assertContains(self.client.get(self.url), '/group/renamed/')
+
+
+@override_settings(COMMENTS_FIRST_PAGE_SIZE=3, COMMENTS_PAGE_SIZE=2)
+class CommentsPaginationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(text='пост', author=cls.user)
+        for number in range(6):
+            Comment.objects.create(text=f'коммент {number}',
+                                   author=cls.user, post=cls.post)
+
+    def test_first_page_and_load_more(self):
+        """Под постом первая порция комментариев, остальные
+        догружаются фрагментами.
+        """
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 3)
+        self.assertContains(response, 'Показать ещё')
+        more_url = reverse('posts:comments_more',
+                           kwargs={'post_id': self.post.pk})
+        seen = list(comments)
+        after = comments.paginator.next_cursor
+        while after:
+            response = self.client.get(more_url, {'after': after})
+            self.assertTemplateNotUsed(response, 'base.html')
+            comments = response.context['comments']
+            seen.extend(comments)
+            after = comments.paginator.next_cursor
+        self.assertEqual(seen, list(self.post.comments.all()))
+
+    def test_load_more_rejects_bad_cursor(self):
+        """Без верного курсора фрагмент не отдаётся, чтобы первая
+        страница не повторилась под самой собой.
+        """
+        more_url = reverse('posts:comments_more',
+                           kwargs={'post_id': self.post.pk})
+        for params in ({}, {'after': ''}, {'after': 'не-курсор'}):
+            with self.subTest(params=params):
+                response = self.client.get(more_url, params)
+                self.assertEqual(response.status_code, 400)
+
+
+class SearchViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.rare = Post.objects.create(
+            text='Кошка спит на окне', author=cls.user
+        )
+        cls.often = Post.objects.create(
+            text='Кошка, кошка и ещё раз кошка', author=cls.user
+        )
+        for number in range(NUMBER_OF_POSTS + 1):
+            Post.objects.create(text=f'Собака номер {number}',
+                                author=cls.user)
+
+    def search(self, query, **params):
+        return self.client.get(reverse('posts:search'),
+                               {'q': query, **params})
+
+    def test_results_ranked_by_relevance(self):
+        """Пост, где слово встречается чаще, идёт первым."""
+        response = self.search('кошка')
+        self.assertEqual(list(response.context['page_obj']),
+                         [self.often, self.rare])
+
+    def test_index_follows_edits_and_deletes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        rare = Post.objects.get(pk=self.rare.pk)
+        rare.text = 'Попугай на окне'
+        rare.save()
+        Post.objects.filter(pk=self.often.pk).delete()
+        self.assertEqual(list(self.search('кошка').context['page_obj']), [])
+        self.assertEqual(list(self.search('попуг').context['page_obj']),
+                         [rare])
+
+    def test_results_paginated(self):
+        """Результаты делятся на страницы, запрос сохраняется в ссылках."""
+        response = self.search('собака')
+        self.assertEqual(response.context['page_obj'].paginator.count,
+                         NUMBER_OF_POSTS + 1)
+        self.assertContains(response, '?q=%D1%81%D0%BE%D0%B1%D0%B0%D0%BA'
+                                      '%D0%B0&amp;page=2')
+        response = self.search('собака', page=2)
+        self.assertEqual(len(response.context['page_obj']), 1)
+
+    def test_syntax_characters_ignored(self):
+        """Кавычки и операторы FTS5 в запросе не ломают поиск."""
+        response = self.search('"кошка* (')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'].paginator.count, 2)
+        response = self.search('!!!')
+        self.assertEqual(list(response.context['page_obj']), [])
+
+
+SMALL_GIF = (b'\x47\x49\x46\x38\x39\x61\x02\x00'
+             b'\x01\x00\x80\x00\x00\x00\x00\x00'
+             b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+             b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+             b'\x0A\x00\x3B')
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR))
+class ThumbnailPlaceholderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(
+            text='пост с картинкой', author=cls.user,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_placeholder_until_thumbnail_ready(self):
+        """Пока миниатюры нет, лента показывает заглушку, а после
+        её построения — картинку.
+        """
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'thumbnail-placeholder')
+        self.assertIsNone(ready_thumbnail(self.post.image, 'card'))
+        render_thumbnails(self.post.pk, self.post.image.name)
+        thumbnail = ready_thumbnail(self.post.image, 'card')
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'thumbnail-placeholder')
+        self.assertContains(response, thumbnail.url)
+
+    def test_picture_offers_webp_variants(self):
+        """После построения миниатюр страница поста отдаёт <picture>
+        с вариантами WebP нескольких ширин.
+        """
+        render_thumbnails(self.post.pk, self.post.image.name)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        )
+        self.assertContains(response, '<source type="image/webp"')
+        for width in settings.THUMBNAIL_VARIANTS['card']['widths']:
+            variant = ready_thumbnail(self.post.image,
+                                      f'card-{width}w.webp')
+            self.assertTrue(variant.name.endswith('.webp'))
+            self.assertContains(response, f'{variant.url} {width}w')
+
+    def test_page_thumbnails_resolved_in_one_lookup(self):
+        """Миниатюры всей страницы читаются одним запросом к хранилищу."""
+        for number in range(3):
+            post = Post.objects.create(
+                text=f'ещё пост {number}', author=self.user,
+                image=SimpleUploadedFile('small.gif', SMALL_GIF,
+                                         'image/gif'),
+            )
+            render_thumbnails(post.pk, post.image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('posts:index'))
+        lookups = [query for query in queries
+                   if 'thumbnail_kvstore' in query['sql']]
+        self.assertEqual(len(lookups), 1)
+        self.assertContains(response, 'card-img', count=4)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(dir=settings.BASE_DIR),
+                   THUMBNAIL_WORKERS=0)
+class ThumbnailPipelineTest(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_thumbnails_built_on_upload(self):
+        """Миниатюры строятся при создании поста, до первого показа."""
+        user = User.objects.create_user(username='auth')
+        self.client.force_login(user)
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'пост с картинкой',
+            'image': SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        })
+        post = Post.objects.get()
+        self.assertIsNotNone(ready_thumbnail(post.image, 'card'))
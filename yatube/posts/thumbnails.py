@@ -0,0 +1,196 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+
+# Размеры миниатюр, которые выводят шаблоны постов без вариантов.
+BASE_SIZES = {
+    'card': ('960x339', CARD_OPTIONS),
+}
+
+
+def variant_sizes(sizes, variants):
+    """Размеры вместе с вариантами из THUMBNAIL_VARIANTS и источники
+    для <picture>: {размер: [(MIME-тип, [(вариант, ширина), ...])]}.
+    """
+    Image.init()
+    all_sizes = dict(sizes)
+    sources = {}
+    for size, variant in variants.items():
+        geometry, options = sizes[size]
+        width, height = (int(side) for side in geometry.split('x'))
+        sources[size] = []
+        for format_, mime in variant['formats']:
+            if format_ not in Image.SAVE:
+                continue
+            names = []
+            for variant_width in variant['widths']:
+                name = f'{size}-{variant_width}w.{format_.lower()}'
+                variant_height = round(variant_width * height / width)
+                all_sizes[name] = (f'{variant_width}x{variant_height}',
+                                   dict(options, format=format_))
+                names.append((name, variant_width))
+            sources[size].append((mime, names))
+    return all_sizes, sources
+
+
+# Все размеры миниатюр, которые выводят шаблоны постов: запасные
+# миниатюры и варианты для <picture>.
+THUMBNAIL_SIZES, PICTURE_SOURCES = variant_sizes(
+    BASE_SIZES, settings.THUMBNAIL_VARIANTS
+)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def thumbnail_file(file_, geometry, options):
+    """Файл миниатюры с тем же именем, что даст get_thumbnail,
+    но без обращения к картинке.
+    """
+    backend = default.backend
+    source = ImageFile(file_)
+    options = dict(options)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def ready_thumbnail(file_, size):
+    """Готовая миниатюра размера `size` или None, если её ещё нет."""
+    if not file_:
+        return None
+    geometry, options = THUMBNAIL_SIZES[size]
+    return default.kvstore.get(thumbnail_file(file_, geometry, options))
+
+
+def ready_thumbnails(posts):
+    """Готовые миниатюры картинок постов одним чтением хранилища.
+
+    Возвращает {id поста: {размер: миниатюра или None}} для постов
+    с картинкой.
+    """
+    posts = [post for post in posts if post.image]
+    sizes = list(THUMBNAIL_SIZES)
+    thumbnails = iter(default.kvstore.get_many([
+        thumbnail_file(post.image, *THUMBNAIL_SIZES[size])
+        for post in posts for size in sizes
+    ]))
+    return {
+        post.pk: {size: next(thumbnails) for size in sizes}
+        for post in posts
+    }
+
+
+def post_picture(post, thumbnails, size='card'):
+    """Контекст для posts/includes/picture.html или None, пока нет
+    запасной миниатюры.
+
+    `thumbnails` — миниатюры поста из ready_thumbnails(). Если каких-то
+    не хватает, их построение ставится в очередь; формат попадает
+    в <picture>, только когда готовы все его ширины.
+    """
+    if not post.image:
+        return None
+    if not all(thumbnails.get(name) for name in THUMBNAIL_SIZES):
+        schedule_thumbnails(post)
+    fallback = thumbnails.get(size)
+    if fallback is None:
+        return None
+    sources = []
+    for mime, variants in PICTURE_SOURCES.get(size, []):
+        files = [(thumbnails.get(name), width) for name, width in variants]
+        if all(thumbnail for thumbnail, _ in files):
+            sources.append({'type': mime, 'srcset': ', '.join(
+                f'{thumbnail.url} {width}w' for thumbnail, width in files
+            )})
+    return {'img': fallback, 'sources': sources}
+
+
+def render_thumbnails(post_id, image_name):
+    """Строит недостающие миниатюры картинки поста, декодируя её
+    один раз, и сбрасывает кэш карточки и лент, где пост мог
+    показаться с заглушкой.
+    """
+    from .cards import bump_card_version
+    from .signals import bump_post_pages
+
+    source = ImageFile(image_name, Post._meta.get_field('image').storage)
+    sizes = [
+        THUMBNAIL_SIZES[size] for size in THUMBNAIL_SIZES
+        if ready_thumbnail(source, size) is None
+    ]
+    if sizes:
+        with default.engine.decoded_once(source, sizes):
+            for geometry, options in sizes:
+                get_thumbnail(source, geometry, **options)
+    post = Post.objects.filter(pk=post_id).only('author', 'group').first()
+    if post is not None:
+        bump_card_version('post', post.pk)
+        bump_post_pages(post.author_id, [post.group_id])
+
+
+def _run(key, in_worker):
+    try:
+        render_thumbnails(*key)
+    except Exception:
+        logger.exception('thumbnails for post %s failed', key[0])
+    finally:
+        with _lock:
+            _pending.discard(key)
+        if in_worker:
+            connection.close()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def _submit(key):
+    with _lock:
+        if key in _pending:
+            return
+        _pending.add(key)
+    if settings.THUMBNAIL_WORKERS:
+        _get_executor().submit(_run, key, True)
+    else:
+        _run(key, False)
+
+
+def schedule_thumbnails(post):
+    """Отдаёт картинку поста пулу потоков после фиксации транзакции.
+
+    Повторный вызов, пока миниатюры строятся, ничего не делает.
+    При THUMBNAIL_WORKERS = 0 миниатюры строятся сразу.
+    """
+    if post.image:
+        key = (post.pk, post.image.name)
+        transaction.on_commit(lambda: _submit(key))
@@ -0,0 +1,117 @@
+from itertools import islice
+
+from django.conf import settings
+
+from core.jobs import enqueue, task
+from .models import Follow, Post, TimelineEntry, UserStats
+
+TIMELINE_BATCH_SIZE = 1000
+
+
+def follower_counts(author_ids):
+    """Число подписчиков авторов из счётчиков UserStats.
+
+    У авторов без строки счётчиков число считается с ограничением
+    сверху FEED_PUSH_FOLLOWER_LIMIT + 1.
+    """
+    limit = settings.FEED_PUSH_FOLLOWER_LIMIT
+    counts = dict(UserStats.objects.filter(
+        user_id__in=author_ids
+    ).values_list('user_id', 'followers_count'))
+    for pk in set(author_ids) - counts.keys():
+        counts[pk] = Follow.objects.filter(author_id=pk)[:limit + 1].count()
+    return counts
+
+
+def pulled_authors(author_ids):
+    """Авторы, чьи посты не раскладываются по лентам, а читаются
+    при показе ленты.
+    """
+    limit = settings.FEED_PUSH_FOLLOWER_LIMIT
+    return {
+        pk for pk, count in follower_counts(author_ids).items()
+        if count > limit
+    }
+
+
+def _bulk_insert(entries):
+    entries = iter(entries)
+    batch = list(islice(entries, TIMELINE_BATCH_SIZE))
+    while batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        batch = list(islice(entries, TIMELINE_BATCH_SIZE))
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост по лентам подписчиков автора."""
+    if pulled_authors([post.author_id]):
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id
+    ).values_list('user_id', flat=True)
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post_id=post.pk,
+                      author_id=post.author_id, pub_date=post.pub_date)
+        for user_id in followers.iterator()
+    )
+
+
+def backfill_timeline(user_id, author_id):
+    """Добавляет в ленту пользователя все посты нового автора."""
+    if pulled_authors([author_id]):
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date'
+    )
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post_id=pk,
+                      author_id=author_id, pub_date=pub_date)
+        for pk, pub_date in posts.iterator()
+    )
+
+
+@task
+def push_author(author_id):
+    """Раскладывает все посты автора по лентам его подписчиков.
+
+    Пока автор был популярным, его новые посты и новые подписки
+    на него в ленты не попадали; без этого они пропали бы из лент,
+    когда автор снова стал раскладываться при публикации.
+    """
+    if pulled_authors([author_id]):
+        return
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    for user_id in followers.iterator():
+        backfill_timeline(user_id, author_id)
+
+
+def author_unfollowed(author_id):
+    """Ставит в очередь push_author, если после отписки число
+    подписчиков автора опустилось до FEED_PUSH_FOLLOWER_LIMIT.
+    """
+    limit = settings.FEED_PUSH_FOLLOWER_LIMIT
+    if follower_counts([author_id])[author_id] == limit:
+        enqueue(push_author, author_id)
+
+
+def prune_timeline(user_id, author_id):
+    """Убирает из ленты пользователя посты автора, от которого
+    он отписался.
+    """
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild_timelines(user_ids=None):
+    """Пересобирает ленты с нуля и возвращает число записей в них."""
+    entries = TimelineEntry.objects.all()
+    follows = Follow.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+        follows = follows.filter(user_id__in=user_ids)
+    entries.delete()
+    pairs = follows.values_list('user_id', 'author_id').distinct()
+    for user_id, author_id in pairs.iterator():
+        backfill_timeline(user_id, author_id)
+    return entries.count()
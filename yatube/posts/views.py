@@ -1,23 +1,32 @@
+from django.conf import settings
 from django.contrib.auth import get_user
 from django.contrib.auth.decorators import login_required
+from django.core.paginator import Paginator
+from django.http import HttpResponseBadRequest
 from django.shortcuts import get_object_or_404, redirect, render
+from django.utils.http import urlencode
 from .forms import CommentForm, PostForm
+from .feed import FollowFeedPaginator
 from .models import Group, Post, User, Comment, Follow
-from core.utils import posts_paginator
-from django.views.decorators.cache import cache_page
+from core.pagecache import versioned_cache_page
+from core.uploads import add_upload_errors, stream_image_uploads
+from core.utils import CursorPaginator, count_cache_key, posts_paginator
+from .counters import user_stats
+from .search import search_posts
+from .thumbnails import schedule_thumbnails
 
 
 NUMBER_OF_POSTS = 10
-CACHE_TIMER = 20
 
 
-@cache_page(CACHE_TIMER, key_prefix='index_page')
+@versioned_cache_page(lambda request: ('index',))
 def index(request):
     """Главная страница"""
     template = "posts/index.html"
     title = "Последние обновления на сайте"
-    post_list = Post.objects.all()
-    page_obj = posts_paginator(request, post_list, NUMBER_OF_POSTS)
+    post_list = Post.objects.for_cards()
+    page_obj = posts_paginator(request, post_list, NUMBER_OF_POSTS,
+                               count_cache_key('posts'))
     context = {
         'posts': post_list,
         'page_obj': page_obj,
@@ -26,13 +35,15 @@ def index(request):
     return render(request, template, context)
 
 
+@versioned_cache_page(lambda request, slug: ('group', slug))
 def group_posts(request, slug):
     """Страница группы"""
     template = 'posts/group_list.html'
     group = get_object_or_404(Group, slug=slug)
     title = f"Записи сообщества {group.title}"
-    post_list = group.grouped_posts.all()
-    page_obj = posts_paginator(request, post_list, NUMBER_OF_POSTS)
+    post_list = group.grouped_posts.for_cards()
+    page_obj = posts_paginator(request, post_list, NUMBER_OF_POSTS,
+                               count_cache_key('group', group.pk))
 
     context = {
         'title': title,
@@ -44,12 +55,17 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@versioned_cache_page(lambda request, username: ('profile', username))
 def profile(request, username):
     """Профаил пользователя"""
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    posts = author.authored_posts.all()
-    page_obj = posts_paginator(request, posts, NUMBER_OF_POSTS)
+    author = get_object_or_404(User.objects.select_related('stats'),
+                               username=username)
+    stats = user_stats(author)
+    posts = author.authored_posts.for_cards()
+    posts_count_key = count_cache_key('author', author.pk)
+    page_obj = posts_paginator(request, posts, NUMBER_OF_POSTS,
+                               posts_count_key)
     following = (request.user.is_authenticated
                  and Follow.objects.filter(user=request.user,
                                            author=author,
@@ -57,6 +73,8 @@ def profile(request, username):
                  )
     context = {
         'posts': posts,
+        'posts_count': stats.posts_count,
+        'stats': stats,
         'author': author,
         'page_obj': page_obj,
         'following': following,
@@ -64,14 +82,39 @@ def profile(request, username):
     return render(request, template, context)
 
 
+def search(request):
+    """Поиск по текстам постов"""
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        paginator = Paginator(search_posts(query), NUMBER_OF_POSTS)
+        page_obj = paginator.get_page(request.GET.get('page'))
+    context = {
+        'title': f'Поиск: {query}' if query else 'Поиск',
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def comments_page(post, per_page, after=None):
+    """Страница комментариев к посту, от новых к старым."""
+    comments = Comment.objects.filter(post=post).select_related('author')
+    paginator = CursorPaginator(comments, per_page, date_field='created')
+    return paginator.get_page(after=after)
+
+
 def post_detail(request, post_id):
     """Детали поста"""
     template = 'posts/post_detail.html'
-    post = Post.objects.get(pk=post_id)
+    post = Post.objects.for_cards().select_related(
+        'author__stats'
+    ).get(pk=post_id)
     form = CommentForm(request.POST or None)
     author = post.author
-    comments = Comment.objects.filter(post=post)
-    posts_num = Post.objects.filter(author=author).count()
+    comments = comments_page(post, settings.COMMENTS_FIRST_PAGE_SIZE)
+    posts_num = user_stats(author).posts_count
     context = {
         'post_num': posts_num,
         'post': post,
@@ -82,21 +125,40 @@ def post_detail(request, post_id):
     return render(request, template, context)
 
 
+def comments_more(request, post_id):
+    """Следующая порция комментариев для кнопки «Показать ещё».
+
+    Без верного курсора отвечает 400: первая страница уже на экране,
+    и скрипт добавил бы её комментарии второй раз.
+    """
+    after = request.GET.get('after')
+    if CursorPaginator.decode_cursor(after) is None:
+        return HttpResponseBadRequest('Неверный курсор комментариев')
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    context = {
+        'post': post,
+        'comments': comments_page(post, settings.COMMENTS_PAGE_SIZE, after),
+    }
+    return render(request, 'includes/comment_list.html', context)
+
+
 @login_required
+@stream_image_uploads
 def post_create(request):
     """Создание поста."""
     template = 'posts/create_post.html'
     user = get_user(request)
-    if request.method == 'POST':
-        form = PostForm(request.POST or None,
-                        files=request.FILES or None
-                        )
-        if form.is_valid():
-            frm = form.save(commit=False)
-            frm.author = user
-            frm.save()
-            return redirect(f'/profile/{user.username}/')
-    form = PostForm()
+    # Форма связана с любым POST: отклонённая загрузка оставляет его пустым.
+    form = PostForm(request.POST if request.method == 'POST' else None,
+                    files=request.FILES or None
+                    )
+    add_upload_errors(form, request)
+    if request.method == 'POST' and form.is_valid():
+        frm = form.save(commit=False)
+        frm.author = user
+        frm.save()
+        schedule_thumbnails(frm)
+        return redirect(f'/profile/{user.username}/')
     context = {
         'form': form,
         'is_edit': False,
@@ -105,19 +167,23 @@ def post_create(request):
 
 
 @login_required
+@stream_image_uploads
 def post_edit(request, post_id):
     """Редактирование поста."""
     template = 'posts/create_post.html'
     post = get_object_or_404(Post, pk=post_id)
     if request.user != post.author:
         return redirect('posts:post_detail', post_id=post_id)
-    form = PostForm(request.POST or None,
+    form = PostForm(request.POST if request.method == 'POST' else None,
                     files=request.FILES or None,
                     instance=post
                     )
+    add_upload_errors(form, request)
     if request.method == 'POST':
-        if form.is_valid:
+        if form.is_valid():
             form.save()
+            if 'image' in form.changed_data:
+                schedule_thumbnails(post)
             return redirect('posts:post_detail', post_id=post_id)
     context = {
         'post': post,
@@ -143,10 +209,17 @@ def add_comment(request, post_id):
 @login_required
 def follow_index(request):
     """Страница подписок"""
-    posts = Post.objects.filter(author__following__user=request.user)
-    page_obj = posts_paginator(request, posts, NUMBER_OF_POSTS)
+    posts = Post.objects.for_cards().filter(
+        author__following__user=request.user
+    )
+    page_obj = posts_paginator(
+        request, posts, NUMBER_OF_POSTS,
+        count_cache_key('follow', request.user.pk),
+        FollowFeedPaginator(request.user, NUMBER_OF_POSTS),
+    )
     context = {
-        'page_obj': page_obj
+        'page_obj': page_obj,
+        'stats': user_stats(request.user),
     }
     return render(request, 'posts/follow.html', context)
 
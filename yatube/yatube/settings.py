@@ -144,8 +144,15 @@ LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
 
 
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+# Письма складываются в таблицу исходящих, а задача очереди отправляет
+# их через OUTBOX_TRANSPORT пачками по OUTBOX_BATCH_SIZE; после
+# OUTBOX_MAX_ATTEMPTS неудач письмо остаётся как недоставленное
+EMAIL_BACKEND = 'core.mail.OutboxBackend'
+OUTBOX_TRANSPORT = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_JOB_PRIORITY = 10
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
@@ -155,6 +162,61 @@ CACHES = {
     }
 }
 
+# Выше этого порога паджинатор показывает «много страниц» вместо COUNT(*)
+PAGINATOR_EXACT_COUNT_LIMIT = 10000
+PAGINATOR_COUNT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а дочитываются при показе ленты подписок
+FEED_PUSH_FOLLOWER_LIMIT = 1000
+
+# Готовые карточки постов сбрасываются сигналами, срок жизни — страховка
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Ленты кэшируются надолго: сигналы меняют версию ключа при любой правке
+PAGE_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Комментарии под постом: сколько показать сразу и сколько догружать
+COMMENTS_FIRST_PAGE_SIZE = 20
+COMMENTS_PAGE_SIZE = 50
+
+# Загрузка картинок: лимиты проверяются по ходу приёма файла
+IMAGE_UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 8000 * 6000
+IMAGE_UPLOAD_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+# Запас сверх замеренного числа SQL-запросов, с которым
+# check_query_budget --update записывает бюджет страницы
+QUERY_BUDGET_MARGIN = 1
+
+# Потоки, заранее строящие миниатюры загруженных картинок; 0 — строить
+# их сразу в запросе
+THUMBNAIL_WORKERS = 2
+
+# Адаптивные варианты миниатюр для <picture>: ширины и форматы
+# в порядке предпочтения для каждого размера; форматы, которые
+# не умеет сохранять Pillow, пропускаются
+THUMBNAIL_VARIANTS = {
+    'card': {
+        'widths': (320, 640, 960),
+        'formats': (('AVIF', 'image/avif'), ('WEBP', 'image/webp')),
+    },
+}
+
+THUMBNAIL_BACKEND = 'core.thumbnail_backend.ThumbnailBackend'
+THUMBNAIL_ENGINE = 'core.thumbnail_engine.Engine'
+THUMBNAIL_KVSTORE = 'core.thumbnail_kvstore.KVStore'
+
+# Очередь фоновых задач: сколько задач обработчик run_jobs выполняет
+# сразу, как часто опрашивает очередь, сколько раз и с какой начальной
+# паузой повторяет упавшую задачу и через сколько секунд считает
+# задачу зависшей
+JOB_WORKERS = 4
+JOB_POLL_INTERVAL = 1
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_DELAY = 10
+JOB_TIMEOUT = 10 * 60
+
 INTERNAL_IPS = [
     '127.0.0.1',
 ]